@@ -3,6 +3,7 @@ from logging.config import fileConfig
 from alembic import context
 from sqlalchemy import pool
 from sqlalchemy import engine_from_config
+from sqlalchemy import text
 
 from app.config import SYNC_DATABASE_URL
 from app.database.models import Base
@@ -24,6 +25,9 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+# Arbitrary application-wide key of the advisory lock held while migrating
+MIGRATION_LOCK_KEY = 724_301_558
+
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -52,12 +56,20 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        # Containers starting together run their entrypoints at the same time: the first one
+        # migrates and the others wait, then find nothing left to do
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        connection.commit()
+        try:
+            context.configure(
+                connection=connection, target_metadata=target_metadata
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            connection.commit()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,33 @@
+"""user_directory_indexes
+
+Revision ID: 2c9e5a7d1f34
+Revises: f1b7a93c5e20
+Create Date: 2026-10-18 15:58:21.640917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c9e5a7d1f34'
+down_revision: Union[str, None] = 'f1b7a93c5e20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_users_post_count_id', 'users', [sa.text('post_count DESC'), sa.text('id DESC')])
+    op.create_index('ix_users_username_trgm', 'users', ['username'],
+                    postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'})
+    op.create_index('ix_users_email_trgm', 'users', ['email'],
+                    postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_email_trgm', table_name='users')
+    op.drop_index('ix_users_username_trgm', table_name='users')
+    op.drop_index('ix_users_post_count_id', table_name='users')
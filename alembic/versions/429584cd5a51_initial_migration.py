@@ -7,8 +7,6 @@ Create Date: 2024-08-09 17:10:16.173370
 """
 from alembic import op
 import sqlalchemy as sa
-from sqlalchemy.orm import sessionmaker
-from app.database.models import Base, User, UserProfile, Post
 
 
 # revision identifiers, used by Alembic.
@@ -19,31 +17,66 @@ depends_on = None
 
 
 def upgrade():
-    # Create the engine and session
-    engine = op.get_bind()
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    # Create the tables as they were at this revision, so later migrations apply cleanly
+    users = op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_id', 'users', ['id'])
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_hashed_password', 'users', ['hashed_password'])
+    op.create_index('ix_users_role', 'users', ['role'])
 
-    # Create the tables
-    Base.metadata.create_all(engine)
+    op.create_table(
+        'user_profiles',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('first_name', sa.String(), nullable=True),
+        sa.Column('last_name', sa.String(), nullable=True),
+        sa.Column('phone_number', sa.String(), nullable=True),
+        sa.Column('user_photo', sa.String(), nullable=True),
+        sa.Column('user_age', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id')
+    )
+    op.create_index('ix_user_profiles_id', 'user_profiles', ['id'])
+    op.create_index('ix_user_profiles_first_name', 'user_profiles', ['first_name'])
+    op.create_index('ix_user_profiles_last_name', 'user_profiles', ['last_name'])
+    op.create_index('ix_user_profiles_phone_number', 'user_profiles', ['phone_number'])
+    op.create_index('ix_user_profiles_user_photo', 'user_profiles', ['user_photo'])
+    op.create_index('ix_user_profiles_user_age', 'user_profiles', ['user_age'])
+
+    op.create_table(
+        'posts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_posts_id', 'posts', ['id'])
+    op.create_index('ix_posts_content', 'posts', ['content'])
 
     # Insert initial users and profiles with the provided hashed passwords
     hashed_password = "$2b$12$..LdVfFRwtPCdD.uIjFFS.CUqYIUCD1PaKl6liAFQcJ4Z1ZPI7A4C"
-    user_user = User(username='user', hashed_password=hashed_password, email='user@example.com', role='user')
-    user_admin = User(username='admin', hashed_password=hashed_password, email='admin@example.com', role='admin')
-
-    session.add(user_user)
-    session.add(user_admin)
-    session.commit()
-
-    user_profile_user = UserProfile(user_id=user_user.id)
-    user_profile_admin = UserProfile(user_id=user_admin.id)
-
-    session.add(user_profile_user)
-    session.add(user_profile_admin)
-    session.commit()
+    op.bulk_insert(users, [
+        {'id': 1, 'username': 'user', 'hashed_password': hashed_password, 'email': 'user@example.com', 'role': 'user'},
+        {'id': 2, 'username': 'admin', 'hashed_password': hashed_password, 'email': 'admin@example.com', 'role': 'admin'},
+    ])
+    op.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), 2)")
+    op.execute("INSERT INTO user_profiles (user_id) VALUES (1), (2)")
 
 
 def downgrade():
     # Drop the tables
-    Base.metadata.drop_all(op.get_bind())
+    op.drop_table('posts')
+    op.drop_table('user_profiles')
+    op.drop_table('users')
@@ -0,0 +1,34 @@
+"""stored_photos
+
+Revision ID: 5d80f3a6b217
+Revises: e9a2d7c41f85
+Create Date: 2026-10-18 13:05:27.661092
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d80f3a6b217'
+down_revision: Union[str, None] = 'e9a2d7c41f85'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stored_photos',
+        sa.Column('content_hash', sa.String(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='1', nullable=False),
+        sa.Column('variants', sa.JSON(), nullable=False),
+        sa.PrimaryKeyConstraint('content_hash')
+    )
+    op.add_column('user_profiles', sa.Column('user_photo_hash', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user_profiles', 'user_photo_hash')
+    op.drop_table('stored_photos')
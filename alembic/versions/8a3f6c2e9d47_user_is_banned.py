@@ -0,0 +1,26 @@
+"""user_is_banned
+
+Revision ID: 8a3f6c2e9d47
+Revises: 2c9e5a7d1f34
+Create Date: 2026-10-18 16:41:03.285519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3f6c2e9d47'
+down_revision: Union[str, None] = '2c9e5a7d1f34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('is_banned', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'is_banned')
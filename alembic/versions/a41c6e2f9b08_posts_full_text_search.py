@@ -0,0 +1,33 @@
+"""posts_full_text_search
+
+Revision ID: a41c6e2f9b08
+Revises: 5d80f3a6b217
+Create Date: 2026-10-18 13:47:12.094385
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41c6e2f9b08'
+down_revision: Union[str, None] = '5d80f3a6b217'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A B-tree over whole post bodies cannot serve text search and fails on large values
+    op.drop_index('ix_posts_content', table_name='posts')
+    op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(),
+                                     sa.Computed("to_tsvector('english', content)", persisted=True)))
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_column('posts', 'search_vector')
+    op.create_index('ix_posts_content', 'posts', ['content'])
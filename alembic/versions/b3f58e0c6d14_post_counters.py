@@ -0,0 +1,35 @@
+"""post_counters
+
+Revision ID: b3f58e0c6d14
+Revises: 7c1e4b9d2a63
+Create Date: 2026-10-18 11:02:09.377145
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f58e0c6d14'
+down_revision: Union[str, None] = '7c1e4b9d2a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_table(
+        'counters',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('value', sa.BigInteger(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("UPDATE users SET post_count = (SELECT count(*) FROM posts WHERE posts.user_id = users.id)")
+    op.execute("INSERT INTO counters (name, value) SELECT 'posts', count(*) FROM posts")
+
+
+def downgrade() -> None:
+    op.drop_table('counters')
+    op.drop_column('users', 'post_count')
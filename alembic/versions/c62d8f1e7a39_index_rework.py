@@ -0,0 +1,46 @@
+"""index_rework
+
+Revision ID: c62d8f1e7a39
+Revises: a41c6e2f9b08
+Create Date: 2026-10-18 14:38:50.217734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c62d8f1e7a39'
+down_revision: Union[str, None] = 'a41c6e2f9b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Indexes nothing queries by, or duplicates of the primary key indexes
+DEAD_INDEXES = [
+    ('ix_users_id', 'users', ['id']),
+    ('ix_users_hashed_password', 'users', ['hashed_password']),
+    ('ix_users_role', 'users', ['role']),
+    ('ix_user_profiles_id', 'user_profiles', ['id']),
+    ('ix_user_profiles_first_name', 'user_profiles', ['first_name']),
+    ('ix_user_profiles_last_name', 'user_profiles', ['last_name']),
+    ('ix_user_profiles_phone_number', 'user_profiles', ['phone_number']),
+    ('ix_user_profiles_user_photo', 'user_profiles', ['user_photo']),
+    ('ix_user_profiles_user_age', 'user_profiles', ['user_age']),
+    ('ix_posts_id', 'posts', ['id']),
+]
+
+
+def upgrade() -> None:
+    for name, table, _ in DEAD_INDEXES:
+        op.drop_index(name, table_name=table)
+    # Serves the per-user post lists and the ON DELETE CASCADE from users to posts
+    op.create_index('ix_posts_user_id_created_at_id', 'posts',
+                    ['user_id', sa.text('created_at DESC'), sa.text('id DESC')])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_user_id_created_at_id', table_name='posts')
+    for name, table, columns in DEAD_INDEXES:
+        op.create_index(name, table, columns)
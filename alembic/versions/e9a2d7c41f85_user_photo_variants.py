@@ -0,0 +1,26 @@
+"""user_photo_variants
+
+Revision ID: e9a2d7c41f85
+Revises: b3f58e0c6d14
+Create Date: 2026-10-18 12:21:53.804410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9a2d7c41f85'
+down_revision: Union[str, None] = 'b3f58e0c6d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_profiles', sa.Column('user_photo_variants', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user_profiles', 'user_photo_variants')
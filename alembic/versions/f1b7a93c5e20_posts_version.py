@@ -0,0 +1,25 @@
+"""posts_version
+
+Revision ID: f1b7a93c5e20
+Revises: c62d8f1e7a39
+Create Date: 2026-10-18 15:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b7a93c5e20'
+down_revision: Union[str, None] = 'c62d8f1e7a39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("INSERT INTO counters (name, value) VALUES ('posts_version', 0) ON CONFLICT (name) DO NOTHING")
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM counters WHERE name = 'posts_version'")
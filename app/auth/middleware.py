@@ -1,68 +1,100 @@
 from fastapi import (HTTPException,
-                     Request,
-                     status)
+                     Request)
 from fastapi.responses import RedirectResponse
-from jwt import PyJWTError
 
 from app.auth.utils import (verify_token,
-                            refresh_access_token,
+                            create_access_token,
                             set_tokens_in_cookies)
+from app.database.crud import get_cached_principal
+from app.database.postgre_db import async_session
 
 ignore_path = ["/login", "/logout"]
 ignore_start = ["/docs", "/openapi.json"]
 
+# Sessions for principal lookups. A session only checks out a connection for its first
+# statement, so requests answered from the principal cache never touch the pool.
+principal_sessions = async_session
 
-async def handle_token_refresh(refresh_token, call_next, request):
-    try:
-        new_access_token = refresh_access_token(refresh_token)
-        response = await call_next(request)
-        response = set_tokens_in_cookies(response, access_token=new_access_token)
 
-        if refresh_token:
-            response = set_tokens_in_cookies(response, refresh_token=refresh_token)
+def resolve_principal(access_token: str | None, refresh_token: str | None):
+    """
+    Decode the auth cookies, decoding at most one token.
 
-        return response
+    Returns:
+        tuple: The principal dict carried by the token (or None) and whether it had to be
+        restored from the refresh token.
+    """
+    if access_token:
+        try:
+            return verify_token(access_token, "access_token"), False
+        except HTTPException:
+            pass
 
-    except HTTPException as e:
-        if e.status_code == status.HTTP_401_UNAUTHORIZED:
-            response = RedirectResponse(url="/login")
-            response.delete_cookie(key="access_token")
-            response.delete_cookie(key="refresh_token")
-            return response
+    if refresh_token:
+        try:
+            return verify_token(refresh_token, "refresh_token"), True
+        except HTTPException:
+            return None, False
+
+    return None, False
+
+
+async def current_principal(token_principal: dict | None):
+    """
+    Check a token's principal against the principal cache.
+
+    Tokens outlive role changes and deletions, so only the user id is taken from them:
+    the username and role come from the cache, and deleted users resolve to None.
+    """
+    if token_principal is None:
+        return None
+    async with principal_sessions() as db:
+        return await get_cached_principal(db, token_principal['user_id'])
 
 
 async def check_access_token(request: Request, call_next):
-    if request.url.path.startswith('/protected'):
-        access_token = request.cookies.get("access_token")
-        refresh_token = request.cookies.get("refresh_token")
-
-        if access_token:
-            try:
-                payload = verify_token(access_token, "access_token")
-            except HTTPException as e:
-                if e.status_code == status.HTTP_401_UNAUTHORIZED:
-                    return await handle_token_refresh(refresh_token, call_next, request)
-        elif refresh_token:
-            return await handle_token_refresh(refresh_token, call_next, request)
-        else:
-            return RedirectResponse(url="/login")
+    access_token = request.cookies.get("access_token")
+    refresh_token = request.cookies.get("refresh_token")
+    token_principal, refreshed = resolve_principal(access_token, refresh_token)
+    principal = await current_principal(token_principal)
+    request.state.principal = principal
+
+    new_access_token = None
+    if principal is not None and (refreshed or principal['role'] != token_principal['role']):
+        # Reissued with the current role, so the token stops carrying a stale one
+        new_access_token = create_access_token(principal['user_id'], principal['username'], principal['role'])
+
+    path = request.url.path
+    if path.rstrip('/') in ignore_path or any(path.startswith(start) for start in ignore_start):
+        # Login and logout manage the auth cookies themselves
+        return await call_next(request)
+
+    if path.startswith('/protected'):
+        if principal is None:
+            response = RedirectResponse(url="/login")
+            if access_token or refresh_token:
+                response.delete_cookie(key="access_token")
+                response.delete_cookie(key="refresh_token")
+            return response
         response = await call_next(request)
-        response = set_tokens_in_cookies(response, access_token, refresh_token)
+        response = set_tokens_in_cookies(response, new_access_token or access_token, refresh_token)
     else:
         response = await call_next(request)
+        if token_principal is not None and principal is None:
+            # Banned or deleted: drop the tokens instead of checking them on every request
+            response.delete_cookie(key="access_token")
+            response.delete_cookie(key="refresh_token")
+        elif new_access_token:
+            response = set_tokens_in_cookies(response, access_token=new_access_token)
 
     return response
 
 
 async def check_user(request: Request):
-    refresh_token = request.cookies.get("refresh_token")
+    """
+    Return the principal of the request, or None for anonymous and deleted users.
 
-    if refresh_token is None:
-        return None
-    try:
-        username, role = verify_token(refresh_token, "refresh_token")
-        return {'username': username, 'role': role}
-    except HTTPException:
-        return None
-    except PyJWTError:
-        return None
+    The principal is resolved by check_access_token through the principal cache, so it
+    always carries the current role.
+    """
+    return getattr(request.state, 'principal', None)
@@ -0,0 +1,68 @@
+import time
+from collections import OrderedDict
+
+from app.config import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL
+from app.tools.invalidation import invalidation_bus
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache with TTL mapping a user id to its username and role.
+
+    A cached None means the user does not exist. Entries are dropped explicitly when a
+    role changes or a user is deleted, in every worker through the invalidation bus; the
+    TTL only bounds staleness for anything else.
+    """
+
+    def __init__(self, maxsize: int = PRINCIPAL_CACHE_SIZE, ttl: int = PRINCIPAL_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, dict | None]] = OrderedDict()
+
+    def get(self, user_id: int) -> tuple[bool, dict | None]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, user_id: int, principal: dict | None):
+        self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids: list[int], broadcast: bool = True):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+        if broadcast:
+            invalidation_bus.publish('principal', list(user_ids))
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+principal_cache = PrincipalCache()
+invalidation_bus.subscribe('principal',
+                           lambda user_ids: principal_cache.invalidate_many(user_ids, broadcast=False),
+                           principal_cache.clear)
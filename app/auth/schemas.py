@@ -31,6 +31,8 @@ class UserProfileUpdate(BaseModel):
     last_name: Optional[str] = None
     phone_number: Optional[str] = None
     user_photo: Optional[str] = None
+    user_photo_variants: Optional[dict] = None
+    user_photo_hash: Optional[str] = None
     user_age: Optional[int] = None
     role: Optional[str] = None  # Add role field
 
@@ -45,5 +47,22 @@ class UserProfileUpdate(BaseModel):
 
 
 class TokenData(BaseModel):
+    user_id: int | None = None
     username: str | None = None
     role: str | None = None
+
+
+class BulkUserAction(BaseModel):
+    action: str
+    user_ids: list[int]
+
+    @field_validator('action')
+    def validate_action(cls, v):
+        if v not in ['delete', 'ban', 'unban']:
+            raise ValueError('Action must be "delete", "ban" or "unban"')
+        return v
+
+
+class PostPurge(BaseModel):
+    post_ids: Optional[list[int]] = None
+    user_ids: Optional[list[int]] = None
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from fastapi import (Request,
@@ -10,7 +12,10 @@ from passlib.context import CryptContext
 from app.config import (ALGORITHM,
                         SECRET_KEY,
                         ACCESS_TOKEN_EXPIRE_MINUTES,
-                        REFRESH_TOKEN_EXPIRE_MINUTES
+                        REFRESH_TOKEN_EXPIRE_MINUTES,
+                        PASSWORD_HASH_EXECUTOR,
+                        PASSWORD_HASH_WORKERS,
+                        PASSWORD_HASH_QUEUE_SIZE
                         )
 from app.tools.functions import redirect_with_message
 from templates.icons import OK_CLASS, OK_ICON
@@ -23,18 +28,66 @@ credentials_exception = HTTPException(
     headers={"WWW-Authenticate": "Bearer"},
 )
 
+password_pool_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many login attempts in progress, please try again",
+    headers={"Retry-After": "1"},
+)
+
+_password_executor: Executor | None = None
+_password_jobs = 0
+
+
+def _get_password_executor() -> Executor:
+    # Created lazily so that forked workers never inherit a pool from the parent process
+    global _password_executor
+    if _password_executor is None:
+        if PASSWORD_HASH_EXECUTOR == 'process':
+            _password_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                    thread_name_prefix="password-hash")
+    return _password_executor
+
+
+async def _run_password_job(func, *args):
+    """
+    Run a bcrypt call in the password pool without blocking the event loop.
+
+    At most PASSWORD_HASH_WORKERS jobs run and PASSWORD_HASH_QUEUE_SIZE more may wait;
+    anything beyond that is rejected with 503 straight away.
+    """
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_SIZE:
+        raise password_pool_busy_exception
+    _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_executor(), func, *args)
+    finally:
+        _password_jobs -= 1
+
 
-def verify_password(plain_password, hashed_password):
+def _verify_password_sync(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_password_hash(password):
+def _get_password_hash_sync(password):
     return pwd_context.hash(password)
 
 
-def create_token(username: str, role: str, token_type: str, expire_delta: int):
+async def verify_password(plain_password, hashed_password):
+    return await _run_password_job(_verify_password_sync, plain_password, hashed_password)
+
+
+async def get_password_hash(password):
+    return await _run_password_job(_get_password_hash_sync, password)
+
+
+def create_token(user_id: int, username: str, role: str, token_type: str, expire_delta: int):
     expire = datetime.utcnow() + timedelta(minutes=expire_delta)
     data = {
+        "user_id": user_id,
         "username": username,
         "role": role,
         "exp": expire,
@@ -47,12 +100,12 @@ def create_token(username: str, role: str, token_type: str, expire_delta: int):
     return encoded_token
 
 
-def create_access_token(username: str, role: str):
-    return create_token(username, role, "access_token", ACCESS_TOKEN_EXPIRE_MINUTES)
+def create_access_token(user_id: int, username: str, role: str):
+    return create_token(user_id, username, role, "access_token", ACCESS_TOKEN_EXPIRE_MINUTES)
 
 
-def create_refresh_token(username: str, role: str):
-    return create_token(username, role, "refresh_token", REFRESH_TOKEN_EXPIRE_MINUTES)
+def create_refresh_token(user_id: int, username: str, role: str):
+    return create_token(user_id, username, role, "refresh_token", REFRESH_TOKEN_EXPIRE_MINUTES)
 
 
 def decode_token(token):
@@ -61,32 +114,26 @@ def decode_token(token):
 
 
 def verify_token(token: str, token_type: str):
+    """
+    Decode a token and return the principal it carries.
+
+    Returns:
+        dict: The user id, username and role stored in the token.
+    """
     try:
         payload = decode_token(token)
-        if payload['type'] == token_type:
-            return payload['username'], payload['role']
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
+        if payload['type'] != token_type:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
+        if 'user_id' not in payload:
+            # Tokens issued before user ids were embedded force a new login
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        return {'user_id': payload['user_id'], 'username': payload['username'], 'role': payload['role']}
     except ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
 
-def refresh_access_token(refresh_token: str):
-    try:
-        payload = decode_token(refresh_token)
-        if payload['type'] == 'refresh_token':
-            username = payload['username']
-            role = payload['role']
-            new_access_token = create_access_token(username, role)
-            return new_access_token
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token expired")
-    except InvalidTokenError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-
-
 def set_tokens_in_cookies(response: RedirectResponse,
                           access_token: str | None = None,
                           refresh_token: str | None = None):
@@ -139,9 +186,9 @@ def clear_tokens_in_cookies(response: RedirectResponse):
     return response
 
 
-async def authenticated_root_redirect(request: Request, username: str, role: str):
-    access_token = create_access_token(username, role)
-    refresh_token = create_refresh_token(username, role)
+async def authenticated_root_redirect(request: Request, user_id: int, username: str, role: str):
+    access_token = create_access_token(user_id, username, role)
+    refresh_token = create_refresh_token(user_id, username, role)
 
     response = await redirect_with_message(request=request,
                                            message_class=OK_CLASS,
@@ -8,6 +8,36 @@ ALGORITHM = getenv('ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '15'))
 REFRESH_TOKEN_EXPIRE_MINUTES = int(getenv('REFRESH_TOKEN_EXPIRE_MINUTES', '10080'))
 
+PASSWORD_HASH_EXECUTOR = getenv('PASSWORD_HASH_EXECUTOR', 'thread')  # 'thread' or 'process'
+PASSWORD_HASH_WORKERS = int(getenv('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_QUEUE_SIZE = int(getenv('PASSWORD_HASH_QUEUE_SIZE', '16'))
+
+PRINCIPAL_CACHE_SIZE = int(getenv('PRINCIPAL_CACHE_SIZE', '10000'))
+PRINCIPAL_CACHE_TTL = int(getenv('PRINCIPAL_CACHE_TTL', '60'))
+
+BULK_CHUNK_SIZE = int(getenv('BULK_CHUNK_SIZE', '500'))  # rows per transaction in bulk moderation
+
+RESPONSE_CACHE_MAX_BYTES = int(getenv('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))  # 0 disables
+RESPONSE_CACHE_TTL = int(getenv('RESPONSE_CACHE_TTL', '60'))
+# Postgres LISTEN/NOTIFY channel relaying cache invalidations between workers; empty disables
+CACHE_INVALIDATION_CHANNEL = getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+PUBLIC_PAGE_SHARED_MAX_AGE = int(getenv('PUBLIC_PAGE_SHARED_MAX_AGE', '30'))  # s-maxage for anonymous pages
+
+COMPRESSION_MINIMUM_SIZE = int(getenv('COMPRESSION_MINIMUM_SIZE', '500'))
+GZIP_LEVEL = int(getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(getenv('BROTLI_QUALITY', '4'))
+
+METRICS_TOKEN = getenv('METRICS_TOKEN', '')  # /metrics requires "Authorization: Bearer <token>"
+# Without a token /metrics would show route names and traffic to anyone, so it is only served with one
+METRICS_ENABLED = getenv('METRICS_ENABLED', 'true').lower() == 'true' and bool(METRICS_TOKEN)
+# Directory where worker processes share metrics snapshots; gunicorn.conf.py sets one by default
+METRICS_DIR = getenv('METRICS_DIR', '')
+METRICS_SNAPSHOT_INTERVAL = float(getenv('METRICS_SNAPSHOT_INTERVAL', '5'))
+# Log requests that issue more SQL statements than their route's budget in app/tools/query_budget.py
+QUERY_BUDGET_WARNINGS = getenv('QUERY_BUDGET_WARNINGS', 'false').lower() == 'true'
+# Test mode: relationship lazy loads that would emit SQL raise instead of silently adding queries
+SQL_STRICT_LOADING = getenv('SQL_STRICT_LOADING', 'false').lower() == 'true'
+
 POSTGRES_HOST = getenv('POSTGRES_HOST', 'localhost')
 POSTGRES_PORT = getenv('POSTGRES_PORT', '5432')
 POSTGRES_USER = getenv('POSTGRES_USER', 'postgres')
@@ -21,6 +51,27 @@ DATABASE_URL = (f"postgresql+asyncpg"
                 f":{POSTGRES_PORT}"
                 f"/{POSTGRES_DB}")
 
+# Read replicas as comma-separated host or host:port, with the primary's credentials and database
+POSTGRES_REPLICA_HOSTS = [host.strip() for host in getenv('POSTGRES_REPLICA_HOSTS', '').split(',') if host.strip()]
+READ_REPLICA_URLS = [(f"postgresql+asyncpg"
+                      f"://{POSTGRES_USER}"
+                      f":{POSTGRES_PASSWORD}"
+                      f"@{host if ':' in host else f'{host}:{POSTGRES_PORT}'}"
+                      f"/{POSTGRES_DB}") for host in POSTGRES_REPLICA_HOSTS]
+# After a write, the user's reads go to the primary for this long so they see their own changes
+READ_YOUR_WRITES_SECONDS = int(getenv('READ_YOUR_WRITES_SECONDS', '5'))
+# A replica that cannot be connected to is skipped for this long, its reads going elsewhere
+REPLICA_RETRY_SECONDS = int(getenv('REPLICA_RETRY_SECONDS', '30'))
+
+DB_POOL_SIZE = int(getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_STATEMENT_CACHE_SIZE = int(getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+# Set when connecting through PgBouncer in transaction mode: disables prepared statement caching
+DB_PGBOUNCER = getenv('DB_PGBOUNCER', 'false').lower() == 'true'
+
 SYNC_DATABASE_URL = (f"postgresql"
                      f"://{POSTGRES_USER}"
                      f":{POSTGRES_PASSWORD}"
@@ -32,3 +83,17 @@ UNSPLASH_ACCESS_KEY = getenv('UNSPLASH_ACCESS_KEY', 'unsplash-access-key')
 
 BASE_DIR = path.dirname(path.dirname(path.abspath(__file__)))
 IMAGE_DIR = path.join(BASE_DIR, 'photo')
+IMAGE_WORKERS = int(getenv('IMAGE_WORKERS', '2'))
+MAX_AVATAR_UPLOAD_BYTES = int(getenv('MAX_AVATAR_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+MAX_AVATAR_PIXELS = int(getenv('MAX_AVATAR_PIXELS', str(40_000_000)))
+
+UNSPLASH_API_URL = getenv('UNSPLASH_API_URL', 'https://api.unsplash.com')
+UNSPLASH_QUERY = getenv('UNSPLASH_QUERY', 'universe galaxy cosmos')
+UNSPLASH_POOL_TTL = int(getenv('UNSPLASH_POOL_TTL', '3600'))
+UNSPLASH_REFRESH_INTERVAL = int(getenv('UNSPLASH_REFRESH_INTERVAL', '900'))
+UNSPLASH_TIMEOUT = float(getenv('UNSPLASH_TIMEOUT', '3.0'))
+UNSPLASH_BREAKER_THRESHOLD = int(getenv('UNSPLASH_BREAKER_THRESHOLD', '3'))
+UNSPLASH_BREAKER_COOLDOWN = int(getenv('UNSPLASH_BREAKER_COOLDOWN', '300'))
+# Directory shared by the workers of one host: one of them refreshes the pool for all
+UNSPLASH_SHARED_DIR = getenv('UNSPLASH_SHARED_DIR', '')
+DEFAULT_UNSPLASH_PHOTO = '/static/img/default_unsplash.jpg'
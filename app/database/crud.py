@@ -1,11 +1,29 @@
+from datetime import datetime
+from enum import Enum
+
 from fastapi import HTTPException
-from sqlalchemy import select, func
+from sqlalchemy import (select, insert, func, tuple_, update, delete, case, or_, exists, values, column,
+                        Integer, String)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.auth.principal_cache import principal_cache
 from app.auth.schemas import UserCreate, UserProfileUpdate
 from app.auth.utils import get_password_hash, verify_password
-from app.database.models import User, UserProfile, Post
+from app.database.models import User, UserProfile, Post, Counter, StoredPhoto, POSTS_COUNTER, POSTS_VERSION_COUNTER
+from app.tools.response_cache import response_cache
+
+
+# First key of the advisory locks taken on stored photo hashes, the second comes from the hash
+STORED_PHOTO_LOCK_NAMESPACE = 5_310_210
+
+
+class MutationResult(Enum):
+    OK = "ok"
+    NOT_FOUND = "not_found"
+    FORBIDDEN = "forbidden"
 
 
 async def get_user_by_username(db: AsyncSession, username: str):
@@ -18,54 +36,116 @@ async def get_user(db: AsyncSession, user_id: int):
     return result
 
 
+async def get_cached_principal(db: AsyncSession, user_id: int):
+    """
+    Return the id, username and role of a user through the principal cache, or None if
+    the user does not exist or is banned.
+    """
+    found, principal = principal_cache.get(user_id)
+    if found:
+        return principal
+    result = await db.execute(select(User.id, User.username, User.role)
+                              .where(User.id == user_id, User.is_banned.is_(False)))
+    row = result.one_or_none()
+    principal = {'user_id': row.id, 'username': row.username, 'role': row.role} if row else None
+    principal_cache.set(user_id, principal)
+    return principal
+
+
 async def get_user_profile(db: AsyncSession, user_id: int):
     result = await db.execute(select(UserProfile).where(UserProfile.user_id == user_id))
     user_profile = result.scalar_one_or_none()
     return user_profile
 
 
-async def get_all_users(db: AsyncSession):
-    result = await db.execute(select(User))
-    return result.scalars().all()
+async def get_users_page(db: AsyncSession,
+                         search: str | None = None,
+                         match: str = "contains",
+                         sort: str = "id",
+                         cursor: tuple[int, ...] | None = None,
+                         limit: int = 50):
+    """
+    Keyset-paginated user directory for the admin list, loading only the displayed columns.
+
+    `search` matches username or email, as a prefix or anywhere depending on `match`, and
+    is served by the trigram indexes. `sort` is "id" (ascending, cursor `(id,)`) or "posts"
+    (most posts first, cursor `(post_count, id)`, served by ix_users_post_count_id).
+
+    Returns:
+        list: Rows with id, username, email, role, post_count and is_banned.
+    """
+    query = select(User.id, User.username, User.email, User.role, User.post_count, User.is_banned)
+    if search:
+        pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"{pattern}%" if match == "prefix" else f"%{pattern}%"
+        query = query.where(or_(User.username.ilike(pattern, escape='\\'),
+                                User.email.ilike(pattern, escape='\\')))
+    if sort == "posts":
+        if cursor:
+            query = query.where(tuple_(User.post_count, User.id) < tuple_(*cursor))
+        query = query.order_by(User.post_count.desc(), User.id.desc())
+    else:
+        if cursor:
+            query = query.where(User.id > cursor[0])
+        query = query.order_by(User.id.asc())
+    result = await db.execute(query.limit(limit))
+    return result.all()
 
 
-async def check_user_exists(db: AsyncSession, username: str, email: str):
-    result = await db.execute(
-        select(User).where(
-            (User.username == username) | (User.email == email)
-        )
-    )
-    user = result.scalar_one_or_none()
-    if user:
-        if user.username == username and user.email == email:
-            return "both"
-        elif user.username == username:
-            return "username"
-        elif user.email == email:
-            return "email"
-    return None
+# Unique indexes whose violation means the username or the email is already registered
+UNIQUE_USER_FIELDS = {'ix_users_username': 'username', 'ix_users_email': 'email'}
 
 
 async def create_user(db: AsyncSession, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
-    db_user = User(username=user.username,
-                   hashed_password=hashed_password,
-                   email=user.email,
-                   role="user")
-    db.add(db_user)
-    await db.flush()
-    db_user_profile = UserProfile(user_id=db_user.id)
-    db.add(db_user_profile)
-    await db.commit()
-    await db.refresh(db_user)
-    return db_user
+    """
+    Insert a user and their empty profile in a single statement.
+
+    Duplicates are not looked up beforehand: the unique indexes on username and email
+    reject them, which also holds for two concurrent sign-ups with the same name.
+
+    Returns:
+        tuple: The new user id and None, or None and which field is already registered
+        ("username", "email" or "both").
+    """
+    hashed_password = await get_password_hash(user.password)
+    new_user = (insert(User)
+                .values(username=user.username, email=user.email, hashed_password=hashed_password, role="user")
+                .returning(User.id)
+                .cte('new_user'))
+    stmt = (insert(UserProfile)
+            .from_select(['user_id'], select(new_user.c.id))
+            .returning(UserProfile.user_id))
+    try:
+        user_id = (await db.execute(stmt)).scalar_one()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        field = UNIQUE_USER_FIELDS.get(_violated_constraint(e))
+        if field is None:
+            raise
+        return None, await _registration_conflict(db, user, field)
+    return user_id, None
+
+
+def _violated_constraint(error: IntegrityError) -> str | None:
+    # asyncpg reports the index name on the driver exception wrapped by the DBAPI adapter
+    cause = getattr(error.orig, '__cause__', None) or error.orig
+    return getattr(cause, 'constraint_name', None)
+
+
+async def _registration_conflict(db: AsyncSession, user: UserCreate, field: str):
+    # Postgres reports only the first violated index, so check the other field as well
+    other = User.email == user.email if field == 'username' else User.username == user.username
+    if await db.scalar(select(exists().where(other))):
+        return "both"
+    return field
 
 
 async def authenticate_user(db: AsyncSession, username: str, password: str):
     user = await get_user_by_username(db, username)
-    if not user:
+    if not user or user.is_banned:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -82,6 +162,10 @@ async def update_user_profile(db: AsyncSession, user_id: int, user_profile: User
             db_user.phone_number = user_profile.phone_number
         if user_profile.user_photo is not None:
             db_user.user_photo = user_profile.user_photo
+        if user_profile.user_photo_variants is not None:
+            db_user.user_photo_variants = user_profile.user_photo_variants
+        if user_profile.user_photo_hash is not None:
+            db_user.user_photo_hash = user_profile.user_photo_hash
         if user_profile.user_age is not None:
             db_user.user_age = user_profile.user_age
         await db.commit()
@@ -91,47 +175,274 @@ async def update_user_profile(db: AsyncSession, user_id: int, user_profile: User
         raise HTTPException(status_code=404, detail="User not found")
 
 
+def _stored_photo_lock_key(content_hash: str) -> int:
+    # The first 32 bits of the hash; two hashes sharing a key only wait for each other
+    return int.from_bytes(bytes.fromhex(content_hash[:8]), 'big', signed=True)
+
+
+async def lock_stored_photos(db: AsyncSession, content_hashes: list[str]):
+    """
+    Take the advisory locks of stored photo hashes until the end of the transaction.
+
+    Writing the files of a photo and registering it, and removing the files of a released
+    one, both happen under its lock, so they never interleave. Keys are locked in
+    ascending order to rule out deadlocks between batches.
+    """
+    keys = sorted({_stored_photo_lock_key(content_hash) for content_hash in content_hashes})
+    if not keys:
+        return
+    key = func.unnest(array(keys, type_=Integer)).table_valued('key')
+    await db.execute(select(func.pg_advisory_xact_lock(STORED_PHOTO_LOCK_NAMESPACE, key.c.key)))
+
+
+async def stored_photo_hashes(db: AsyncSession, content_hashes: list[str]) -> set[str]:
+    """The hashes in the list that have a stored photo."""
+    result = await db.execute(select(StoredPhoto.content_hash).where(StoredPhoto.content_hash.in_(content_hashes)))
+    return set(result.scalars().all())
+
+
+async def acquire_stored_photo(db: AsyncSession, content_hash: str):
+    """
+    Add a reference to an already stored photo.
+
+    Returns:
+        dict | None: The variant manifest, or None if no photo with this hash is stored.
+    """
+    result = await db.execute(update(StoredPhoto)
+                              .where(StoredPhoto.content_hash == content_hash)
+                              .values(ref_count=StoredPhoto.ref_count + 1)
+                              .returning(StoredPhoto.variants)
+                              .execution_options(synchronize_session=False))
+    return result.scalar_one_or_none()
+
+
+async def add_stored_photo(db: AsyncSession, content_hash: str, variants: dict):
+    """
+    Register a newly processed photo with one reference.
+
+    A concurrent upload of the same content may have registered it first, in which case
+    a reference is added to that row and its manifest is returned instead.
+    """
+    stmt = pg_insert(StoredPhoto).values(content_hash=content_hash, ref_count=1, variants=variants)
+    stmt = stmt.on_conflict_do_update(index_elements=[StoredPhoto.content_hash],
+                                      set_={'ref_count': StoredPhoto.ref_count + 1})
+    result = await db.execute(stmt.returning(StoredPhoto.variants))
+    return result.scalar_one()
+
+
+async def release_stored_photo(db: AsyncSession, content_hash: str):
+    """
+    Drop one reference to a stored photo and forget it when no references remain.
+
+    Returns:
+        dict | None: The variant manifest when the last reference was dropped, so the
+        caller can remove the files with remove_released_photos once the transaction is
+        committed.
+    """
+    await db.execute(update(StoredPhoto)
+                     .where(StoredPhoto.content_hash == content_hash)
+                     .values(ref_count=StoredPhoto.ref_count - 1)
+                     .execution_options(synchronize_session=False))
+    result = await db.execute(delete(StoredPhoto)
+                              .where(StoredPhoto.content_hash == content_hash, StoredPhoto.ref_count <= 0)
+                              .returning(StoredPhoto.variants)
+                              .execution_options(synchronize_session=False))
+    return result.scalar_one_or_none()
+
+
+async def release_stored_photos(db: AsyncSession, content_hashes: list[str]):
+    """
+    Set-based release_stored_photo: drop one reference per hash in the list, repeats included.
+
+    Returns:
+        list: (content hash, variant manifest) of the photos whose last reference was dropped.
+    """
+    if not content_hashes:
+        return []
+    counts = {}
+    for content_hash in content_hashes:
+        counts[content_hash] = counts.get(content_hash, 0) + 1
+    released = values(column('content_hash', String), column('n', Integer), name='released').data(list(counts.items()))
+    await db.execute(update(StoredPhoto)
+                     .where(StoredPhoto.content_hash == released.c.content_hash)
+                     .values(ref_count=StoredPhoto.ref_count - released.c.n)
+                     .execution_options(synchronize_session=False))
+    result = await db.execute(delete(StoredPhoto)
+                              .where(StoredPhoto.content_hash.in_(counts), StoredPhoto.ref_count <= 0)
+                              .returning(StoredPhoto.content_hash, StoredPhoto.variants)
+                              .execution_options(synchronize_session=False))
+    return [tuple(row) for row in result.all()]
+
+
 async def delete_user(db: AsyncSession, user_id: int):
-    result = await db.execute(select(User).where(User.id == user_id).options(selectinload(User.profile)))
-    db_user = result.scalars().first()
+    # The profile and the posts go with the user through ON DELETE CASCADE, without being loaded
+    result = await db.execute(delete(User)
+                              .where(User.id == user_id)
+                              .returning(User.post_count)
+                              .execution_options(synchronize_session=False))
+    post_count = result.scalar_one_or_none()
+    if post_count is None:
+        return False
+    await _increment_posts_counter(db, -post_count)
+    await db.commit()
+    _forget_users([user_id])
+    return True
+
+
+async def delete_users(db: AsyncSession, user_ids: list[int]):
+    """
+    Delete a batch of users, their profiles and posts with set-based statements in one transaction.
+
+    Stored avatar references are released in the same transaction.
+
+    Returns:
+        tuple: The ids of the deleted users, (photo path, variant manifest) pairs of the
+        avatar files stored before content addressing, and (content hash, variant manifest)
+        pairs of the stored photos whose last reference was dropped. The caller removes
+        both kinds of files once the transaction is committed.
+    """
+    profiles = (await db.execute(select(UserProfile.user_photo,
+                                        UserProfile.user_photo_variants,
+                                        UserProfile.user_photo_hash)
+                                 .where(UserProfile.user_id.in_(user_ids)))).all()
+    result = await db.execute(delete(User)
+                              .where(User.id.in_(user_ids))
+                              .returning(User.id, User.post_count)
+                              .execution_options(synchronize_session=False))
+    deleted = result.all()
+    await _increment_posts_counter(db, -sum(row.post_count for row in deleted))
+
+    orphaned_files = [(profile.user_photo, profile.user_photo_variants) for profile in profiles
+                      if not profile.user_photo_hash and (profile.user_photo or profile.user_photo_variants)]
+    released_photos = await release_stored_photos(db, [profile.user_photo_hash for profile in profiles
+                                                       if profile.user_photo_hash])
+
+    await db.commit()
+    deleted_ids = [row.id for row in deleted]
+    _forget_users(deleted_ids)
+    return deleted_ids, orphaned_files, released_photos
+
+
+async def set_users_banned(db: AsyncSession, user_ids: list[int], banned: bool):
+    """
+    Ban or unban a batch of users. Banned users cannot log in and resolve to no principal.
+
+    Returns:
+        list: The ids of the users whose state changed.
+    """
+    result = await db.execute(update(User)
+                              .where(User.id.in_(user_ids), User.is_banned.is_not(banned))
+                              .values(is_banned=banned)
+                              .returning(User.id)
+                              .execution_options(synchronize_session=False))
+    changed = result.scalars().all()
+    await db.commit()
+    _forget_users(changed)
+    return changed
 
-    if db_user:
-        await db.delete(db_user)
-        await db.commit()
-        return True
-    return False
+
+def _forget_users(user_ids: list[int]):
+    if not user_ids:
+        return
+    # One call per cache, so other workers hear about the whole batch in one notification
+    principal_cache.invalidate_many(user_ids)
+    response_cache.invalidate_tags("feed",
+                                   *(f"user:{user_id}" for user_id in user_ids),
+                                   *(f"user_posts:{user_id}" for user_id in user_ids))
 
 
 async def get_all_posts(db: AsyncSession):
-    query = select(Post).options(selectinload(Post.user)).order_by(Post.created_at.desc())
+    query = select(Post).options(selectinload(Post.user)).order_by(Post.created_at.desc(), Post.id.desc())
     result = await db.execute(query)
     return result.scalars().all()
 
 
 async def get_total_posts_count(db: AsyncSession):
-    result = await db.execute(select(func.count()).select_from(Post))
-    return result.scalar()
+    result = await db.execute(select(Counter.value).where(Counter.name == POSTS_COUNTER))
+    return result.scalar() or 0
 
 
-async def get_paginated_posts(db: AsyncSession, skip: int = 0, limit: int = 21):
-    query = select(Post).options(selectinload(Post.user)).order_by(Post.created_at.desc()).offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+async def get_paginated_posts(db: AsyncSession, skip: int = 0, limit: int = 21, from_end: bool = False):
+    """
+    OFFSET pagination in feed order, newest first.
+
+    With from_end, skip counts from the oldest post instead: pages near the end of the feed
+    are read with a short ascending scan of ix_posts_created_at_id and reversed, like the
+    "before" direction of get_posts_by_cursor, and the last page needs no OFFSET at all.
+    """
+    query = select(Post).options(selectinload(Post.user))
+    if from_end:
+        query = query.order_by(Post.created_at.asc(), Post.id.asc())
+    else:
+        query = query.order_by(Post.created_at.desc(), Post.id.desc())
+    result = await db.execute(query.offset(skip).limit(limit))
+    posts = result.scalars().all()
+    if from_end:
+        posts = list(reversed(posts))
+    return posts
+
+
+async def get_posts_by_cursor(db: AsyncSession,
+                              cursor: tuple[datetime, int],
+                              direction: str = "after",
+                              limit: int = 21):
+    """
+    Keyset pagination over (created_at, id), served by ix_posts_created_at_id.
+
+    "after" returns the posts that follow the cursor in feed order, "before" returns the
+    posts that precede it. Both are returned newest first.
+    """
+    key = tuple_(Post.created_at, Post.id)
+    query = select(Post).options(selectinload(Post.user))
+    if direction == "before":
+        query = query.where(key > tuple_(*cursor)).order_by(Post.created_at.asc(), Post.id.asc())
+    else:
+        query = query.where(key < tuple_(*cursor)).order_by(Post.created_at.desc(), Post.id.desc())
+    result = await db.execute(query.limit(limit))
+    posts = result.scalars().all()
+    if direction == "before":
+        posts = list(reversed(posts))
+    return posts
+
+
+async def search_posts(db: AsyncSession,
+                       query: str,
+                       cursor: tuple[float, int] | None = None,
+                       limit: int = 21):
+    """
+    Full-text search over posts, best matches first.
+
+    Matching is served by the GIN index on posts.search_vector. Pages continue after a
+    (rank, id) cursor taken from the last result of the previous page.
+
+    Returns:
+        list: (post, rank) tuples.
+    """
+    ts_query = func.websearch_to_tsquery('english', query)
+    rank = func.ts_rank_cd(Post.search_vector, ts_query)
+    stmt = (select(Post, rank.label('rank'))
+            .options(selectinload(Post.user))
+            .where(Post.search_vector.op('@@')(ts_query)))
+    if cursor:
+        stmt = stmt.where(tuple_(rank, Post.id) < tuple_(*cursor))
+    stmt = stmt.order_by(rank.desc(), Post.id.desc()).limit(limit)
+    result = await db.execute(stmt)
+    return result.all()
 
 
 async def get_total_posts_count_by_user(db: AsyncSession, user_id: int):
-    result = await db.execute(select(func.count()).select_from(Post).filter(Post.user_id == user_id))
-    return result.scalar()
+    result = await db.execute(select(User.post_count).where(User.id == user_id))
+    return result.scalar() or 0
 
 
 async def get_paginated_posts_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 15):
-    query = select(Post).filter(Post.user_id == user_id).order_by(Post.created_at.desc()).offset(skip).limit(limit)
+    query = select(Post).filter(Post.user_id == user_id).order_by(Post.created_at.desc(), Post.id.desc()).offset(skip).limit(limit)
     result = await db.execute(query)
     return result.scalars().all()
 
 
 async def get_posts_by_user(db: AsyncSession, user_id: int):
-    query = select(Post).filter(Post.user_id == user_id).order_by(Post.created_at.desc())
+    query = select(Post).filter(Post.user_id == user_id).order_by(Post.created_at.desc(), Post.id.desc())
     result = await db.execute(query)
     return result.scalars().all()
 
@@ -139,7 +450,9 @@ async def get_posts_by_user(db: AsyncSession, user_id: int):
 async def create_post(db: AsyncSession, content: str, user_id: int):
     post = Post(content=content, user_id=user_id)
     db.add(post)
+    await _increment_post_counts(db, user_id, 1)
     await db.commit()
+    response_cache.invalidate_tags("feed", f"user_posts:{user_id}")
     await db.refresh(post)
     return post
 
@@ -150,20 +463,153 @@ async def get_post_by_id(db: AsyncSession, post_id: int):
     return result.scalar_one_or_none()
 
 
-async def update_post(db: AsyncSession, post_id: int, content: str):
-    post = await get_post_by_id(db, post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    post.content = content
+async def update_post(db: AsyncSession, post_id: int, user_id: int, content: str):
+    """
+    Update a post owned by user_id in a single statement.
+
+    The ownership check is part of the UPDATE and the posts version is bumped in a CTE of
+    the same statement. Whether the post exists at all is only looked at to tell a missing
+    post from someone else's.
+
+    Returns:
+        MutationResult: OK, NOT_FOUND or FORBIDDEN.
+    """
+    updated = (update(Post)
+               .where(Post.id == post_id, Post.user_id == user_id)
+               .values(content=content)
+               .returning(Post.id)
+               .cte('updated'))
+    bumped = _posts_counter_statement(0).where(exists(select(updated.c.id))).cte('bumped')
+    result = await _run_post_mutation(db, post_id, updated, bumped)
+    if result is MutationResult.OK:
+        response_cache.invalidate_tags("feed", f"post:{post_id}", f"user_posts:{user_id}")
+    return result
+
+
+async def delete_post(db: AsyncSession, post_id: int, user_id: int):
+    """
+    Delete a post owned by user_id in a single statement, maintaining the post counters.
+
+    Returns:
+        MutationResult: OK, NOT_FOUND or FORBIDDEN.
+    """
+    deleted = (delete(Post)
+               .where(Post.id == post_id, Post.user_id == user_id)
+               .returning(Post.id, Post.user_id)
+               .cte('deleted'))
+    author = (update(User)
+              .where(User.id.in_(select(deleted.c.user_id)))
+              .values(post_count=User.post_count - 1)
+              .cte('author'))
+    counted = _posts_counter_statement(-1).where(exists(select(deleted.c.id))).cte('counted')
+    result = await _run_post_mutation(db, post_id, deleted, author, counted)
+    if result is MutationResult.OK:
+        response_cache.invalidate_tags("feed", f"post:{post_id}", f"user_posts:{user_id}")
+    return result
+
+
+async def _run_post_mutation(db: AsyncSession, post_id: int, changed, *side_effects):
+    # Data-modifying CTEs all run against the snapshot taken before the statement, so the
+    # existence check still sees a post that this very statement deletes
+    query = (select(select(func.count()).select_from(changed).scalar_subquery().label('changed'),
+                    exists().where(Post.id == post_id).label('found'))
+             .add_cte(changed, *side_effects))
+    row = (await db.execute(query)).one()
     await db.commit()
-    await db.refresh(post)
-    return post
+    if row.changed:
+        return MutationResult.OK
+    return MutationResult.FORBIDDEN if row.found else MutationResult.NOT_FOUND
+
 
+async def get_posts_version(db: AsyncSession):
+    result = await db.execute(select(Counter.value).where(Counter.name == POSTS_VERSION_COUNTER))
+    return result.scalar() or 0
 
-async def delete_post(db: AsyncSession, post_id: int):
-    post = await get_post_by_id(db, post_id)
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    await db.delete(post)
+
+async def purge_posts(db: AsyncSession,
+                      post_ids: list[int] | None = None,
+                      user_ids: list[int] | None = None,
+                      limit: int = 500):
+    """
+    Delete up to `limit` posts, picked by id or by author, in one set-based transaction.
+
+    Callers purging by author repeat the call until it returns 0, so every transaction
+    stays short however many posts the authors have.
+
+    Returns:
+        int: The number of posts deleted.
+    """
+    target = select(Post.id)
+    if post_ids is not None:
+        target = target.where(Post.id.in_(post_ids))
+    else:
+        target = target.where(Post.user_id.in_(user_ids or []))
+    result = await db.execute(delete(Post)
+                              .where(Post.id.in_(target.limit(limit).scalar_subquery()))
+                              .returning(Post.id, Post.user_id)
+                              .execution_options(synchronize_session=False))
+    deleted = result.all()
+    if not deleted:
+        return 0
+
+    counts = {}
+    for row in deleted:
+        counts[row.user_id] = counts.get(row.user_id, 0) + 1
+    purged = values(column('user_id', Integer), column('n', Integer), name='purged').data(list(counts.items()))
+    await db.execute(update(User)
+                     .where(User.id == purged.c.user_id)
+                     .values(post_count=User.post_count - purged.c.n)
+                     .execution_options(synchronize_session=False))
+    await _increment_posts_counter(db, -len(deleted))
+    await db.commit()
+
+    response_cache.invalidate_tags("feed", *(f"post:{row.id}" for row in deleted),
+                                   *(f"user_posts:{user_id}" for user_id in counts))
+    return len(deleted)
+
+
+def _posts_counter_statement(delta: int):
+    # Every change to the posts also bumps the posts version, in the same statement. An edit
+    # (delta 0) leaves the posts count alone, so it does not lock that row as well
+    names = (POSTS_COUNTER, POSTS_VERSION_COUNTER) if delta else (POSTS_VERSION_COUNTER,)
+    return (update(Counter)
+            .where(Counter.name.in_(names))
+            .values(value=Counter.value + case((Counter.name == POSTS_VERSION_COUNTER, 1), else_=delta)))
+
+
+async def _increment_posts_counter(db: AsyncSession, delta: int):
+    await db.execute(_posts_counter_statement(delta))
+
+
+async def _increment_post_counts(db: AsyncSession, user_id: int, delta: int):
+    await db.execute(update(User)
+                     .where(User.id == user_id)
+                     .values(post_count=User.post_count + delta))
+    await _increment_posts_counter(db, delta)
+
+
+async def reconcile_post_counts(db: AsyncSession):
+    """
+    Recompute users.post_count and the global posts counter from the posts table.
+
+    Returns the number of users whose counter had drifted and the corrected total.
+    """
+    actual = (select(func.count())
+              .select_from(Post)
+              .where(Post.user_id == User.id)
+              .correlate(User)
+              .scalar_subquery())
+    result = await db.execute(update(User)
+                              .where(User.post_count != actual)
+                              .values(post_count=actual)
+                              .execution_options(synchronize_session=False))
+    drifted_users = result.rowcount
+
+    total = (await db.execute(select(func.count()).select_from(Post))).scalar()
+    counter = await db.get(Counter, POSTS_COUNTER)
+    if counter is None:
+        db.add(Counter(name=POSTS_COUNTER, value=total))
+    else:
+        counter.value = total
     await db.commit()
-    return {"message": "Post deleted successfully"}
+    return drifted_users, total
@@ -1,47 +1,91 @@
 from datetime import datetime
 
-from sqlalchemy import ForeignKey, Text, DateTime
+from sqlalchemy import ForeignKey, Text, DateTime, Index, BigInteger, JSON, Computed, false
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app.config import SQL_STRICT_LOADING
 from app.database.postgre_db import Base
 
+# Relationships are loaded explicitly (selectinload) by the queries that need them. In strict
+# mode an attribute access that would lazy load instead raises, so N+1 queries fail loudly.
+RELATIONSHIP_LOADING = "raise_on_sql" if SQL_STRICT_LOADING else "select"
+
 
 class User(Base):
     __tablename__ = "users"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(unique=True, index=True)
     email: Mapped[str] = mapped_column(unique=True, index=True)
-    hashed_password: Mapped[str] = mapped_column(index=True)
-    role: Mapped[str] = mapped_column(index=True)  # Change to a simple string
+    hashed_password: Mapped[str]
+    role: Mapped[str]  # Change to a simple string
+    post_count: Mapped[int] = mapped_column(default=0, server_default='0')
+    is_banned: Mapped[bool] = mapped_column(default=False, server_default=false())
 
-    profile: Mapped["UserProfile"] = relationship(back_populates="user", uselist=False, cascade="all, delete-orphan")
-    posts: Mapped[list["Post"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    # Profiles and posts are removed by ON DELETE CASCADE, the ORM never loads them to delete a user
+    profile: Mapped["UserProfile"] = relationship(back_populates="user", uselist=False,
+                                                  cascade="all, delete-orphan", passive_deletes=True,
+                                                  lazy=RELATIONSHIP_LOADING)
+    posts: Mapped[list["Post"]] = relationship(back_populates="user", cascade="all, delete-orphan",
+                                               passive_deletes=True, lazy=RELATIONSHIP_LOADING)
 
 
 class UserProfile(Base):
     __tablename__ = "user_profiles"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), unique=True)
-    first_name: Mapped[str] = mapped_column(index=True, nullable=True)
-    last_name: Mapped[str] = mapped_column(index=True, nullable=True)
-    phone_number: Mapped[str] = mapped_column(index=True, nullable=True)
-    user_photo: Mapped[str] = mapped_column(index=True, nullable=True)
-    user_age: Mapped[int] = mapped_column(index=True, nullable=True)
+    first_name: Mapped[str] = mapped_column(nullable=True)
+    last_name: Mapped[str] = mapped_column(nullable=True)
+    phone_number: Mapped[str] = mapped_column(nullable=True)
+    user_photo: Mapped[str] = mapped_column(nullable=True)
+    user_photo_variants: Mapped[dict] = mapped_column(JSON, nullable=True)
+    user_photo_hash: Mapped[str] = mapped_column(nullable=True)  # stored_photos.content_hash
+    user_age: Mapped[int] = mapped_column(nullable=True)
 
-    user: Mapped[User] = relationship(back_populates="profile")
+    user: Mapped[User] = relationship(back_populates="profile", lazy=RELATIONSHIP_LOADING)
 
 
 class Post(Base):
     __tablename__ = "posts"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
-    content: Mapped[str] = mapped_column(Text, index=True)
+    content: Mapped[str] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    search_vector: Mapped[str] = mapped_column(TSVECTOR,
+                                               Computed("to_tsvector('english', content)", persisted=True),
+                                               deferred=True)
 
-    user: Mapped[User] = relationship(back_populates="posts")
+    user: Mapped[User] = relationship(back_populates="posts", lazy=RELATIONSHIP_LOADING)
 
     def truncated_content(self):
         return self.content[:250] + '...' if len(self.content) > 250 else self.content
+
+
+class StoredPhoto(Base):
+    __tablename__ = "stored_photos"
+
+    content_hash: Mapped[str] = mapped_column(primary_key=True)  # SHA-256 of the uploaded file
+    ref_count: Mapped[int] = mapped_column(default=1, server_default='1')
+    variants: Mapped[dict] = mapped_column(JSON)
+
+
+class Counter(Base):
+    __tablename__ = "counters"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0, server_default='0')
+
+
+POSTS_COUNTER = 'posts'
+POSTS_VERSION_COUNTER = 'posts_version'  # bumped on every change to the posts, see app/tools/etag.py
+
+Index('ix_posts_created_at_id', Post.created_at.desc(), Post.id.desc())
+Index('ix_posts_user_id_created_at_id', Post.user_id, Post.created_at.desc(), Post.id.desc())
+Index('ix_posts_search_vector', Post.search_vector, postgresql_using='gin')
+Index('ix_users_post_count_id', User.post_count.desc(), User.id.desc())
+# Trigram indexes serve both prefix and substring ILIKE searches in the admin user directory
+Index('ix_users_username_trgm', User.username, postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'})
+Index('ix_users_email_trgm', User.email, postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
@@ -0,0 +1,243 @@
+"""
+Query-plan regression check for app/database/crud.py.
+
+Runs every CRUD function against a seeded database, captures the SQL it issues and
+explains each statement: SELECTs with EXPLAIN (ANALYZE, BUFFERS), data-modifying
+statements with a plain EXPLAIN so they are not executed twice. A plan that falls back
+to a sequential scan of a large table, or to an explicit sort, is reported as a
+regression and the command exits with status 1. Everything runs in one transaction
+that is rolled back at the end.
+
+Usage:
+    python -m app.database.plan_check --seed    # seed once at realistic scale
+    python -m app.database.plan_check
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.principal_cache import principal_cache
+from app.auth.schemas import UserCreate, UserProfileUpdate
+from app.database import crud
+from app.database.postgre_db import engine
+
+LARGE_TABLES = {'users', 'user_profiles', 'posts'}
+
+SEED_USERS = 100_000
+SEED_POSTS = 1_000_000
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO users (username, email, hashed_password, role)
+    SELECT 'seed_user_' || g, 'seed_user_' || g || '@example.com', 'not-a-hash', 'user'
+    FROM generate_series(1, :users) AS g
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO user_profiles (user_id, first_name)
+    SELECT id, 'Seed' FROM users
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    WITH ids AS (SELECT array_agg(id ORDER BY id) AS a FROM users)
+    INSERT INTO posts (user_id, content, created_at)
+    SELECT ids.a[1 + (g * 7919) % array_length(ids.a, 1)],
+           'Seed post ' || g || ' about galaxy ' || md5(g::text) || ' nebula cosmos stars',
+           now() - make_interval(secs => g * 13)
+    FROM ids, generate_series(1, :posts) AS g
+    """,
+]
+
+
+class StatementRecorder:
+    """Collects (statement, parameters) for every query issued while recording is on."""
+
+    def __init__(self):
+        self.recording = False
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.recording:
+            self.statements.append((statement, parameters))
+
+
+def find_regressions(plan: dict, allowed: set) -> list[str]:
+    problems = []
+    nodes = [plan['Plan']]
+    while nodes:
+        node = nodes.pop()
+        node_type = node['Node Type']
+        relation = node.get('Relation Name')
+        if node_type == 'Seq Scan' and relation in LARGE_TABLES and 'Seq Scan' not in allowed:
+            problems.append(f"Seq Scan on {relation}")
+        if node_type in ('Sort', 'Incremental Sort') and 'Sort' not in allowed:
+            problems.append(f"{node_type} on {node.get('Sort Key')}")
+        nodes.extend(node.get('Plans', []))
+    return problems
+
+
+async def explain(conn, statement: str, parameters):
+    if statement.lstrip().upper().startswith('SELECT'):
+        prefix = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+    else:
+        prefix = "EXPLAIN (FORMAT JSON) "
+    result = await conn.exec_driver_sql(prefix + statement, parameters)
+    plan = result.scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+async def seed(conn, users: int, posts: int):
+    logger.info(f"Seeding {users} users and {posts} posts")
+    for statement in SEED_STATEMENTS:
+        await conn.execute(text(statement), {'users': users, 'posts': posts})
+    await conn.execute(text("UPDATE users SET post_count = "
+                            "(SELECT count(*) FROM posts WHERE posts.user_id = users.id)"))
+    await conn.execute(text("INSERT INTO counters (name, value) SELECT 'posts', count(*) FROM posts "
+                            "ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value"))
+
+
+async def load_samples(conn) -> dict:
+    user = (await conn.execute(text(
+        "SELECT id, username, email FROM users ORDER BY post_count DESC LIMIT 1"))).one()
+    post = (await conn.execute(text(
+        "SELECT id, created_at FROM posts WHERE user_id = :user_id "
+        "ORDER BY created_at DESC, id DESC LIMIT 1"), {'user_id': user.id})).one()
+    middle = (await conn.execute(text(
+        "SELECT id, created_at FROM posts ORDER BY created_at DESC, id DESC OFFSET 5000 LIMIT 1"))).one_or_none()
+    middle = middle or post
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'post_id': post.id,
+        'cursor': (middle.created_at, middle.id),
+    }
+
+
+def build_checks(s: dict):
+    """(name, allowed plan nodes, coroutine function taking a session) for every CRUD function."""
+    profile_update = UserProfileUpdate(first_name="Plan", last_name="Check")
+    new_user = UserCreate(username="plan_check_user", email="plan_check_user@example.com",
+                          password="plan-check", role="user")
+    duplicate_user = UserCreate(username=s['username'], email="plan_check_duplicate@example.com",
+                                password="plan-check", role="user")
+    return [
+        ("get_user_by_username", set(), lambda db: crud.get_user_by_username(db, s['username'])),
+        ("get_user", set(), lambda db: crud.get_user(db, s['user_id'])),
+        ("get_cached_principal", set(), lambda db: crud.get_cached_principal(db, s['user_id'])),
+        ("get_user_profile", set(), lambda db: crud.get_user_profile(db, s['user_id'])),
+        ("get_users_page by id", set(), lambda db: crud.get_users_page(db, sort="id", cursor=(s['user_id'],))),
+        ("get_users_page by posts", set(), lambda db: crud.get_users_page(db, sort="posts")),
+        # The trigram index finds the matches, ordering them needs a top-N sort
+        ("get_users_page search", {'Sort'},
+         lambda db: crud.get_users_page(db, search=s['username'], sort="posts")),
+        ("create_user", set(), lambda db: crud.create_user(db, new_user)),
+        ("create_user duplicate", set(), lambda db: crud.create_user(db, duplicate_user)),
+        ("authenticate_user", set(), lambda db: crud.authenticate_user(db, s['username'], "wrong-password")),
+        ("update_user_profile", set(), lambda db: crud.update_user_profile(db, s['user_id'], profile_update)),
+        ("add_stored_photo", set(), lambda db: crud.add_stored_photo(db, "0" * 64, {})),
+        ("acquire_stored_photo", set(), lambda db: crud.acquire_stored_photo(db, "0" * 64)),
+        ("release_stored_photo", set(), lambda db: crud.release_stored_photo(db, "0" * 64)),
+        ("lock_stored_photos", set(), lambda db: crud.lock_stored_photos(db, ["0" * 64, "f" * 64])),
+        ("stored_photo_hashes", set(), lambda db: crud.stored_photo_hashes(db, ["0" * 64, "f" * 64])),
+        # Unbounded listing of every post: reading the whole table is the expected plan
+        ("get_all_posts", {'Seq Scan', 'Sort'}, lambda db: crud.get_all_posts(db)),
+        ("get_total_posts_count", set(), lambda db: crud.get_total_posts_count(db)),
+        ("get_posts_version", set(), lambda db: crud.get_posts_version(db)),
+        ("get_paginated_posts", set(), lambda db: crud.get_paginated_posts(db, skip=0, limit=21)),
+        ("get_paginated_posts from the end", set(),
+         lambda db: crud.get_paginated_posts(db, skip=0, limit=21, from_end=True)),
+        ("get_posts_by_cursor after", set(),
+         lambda db: crud.get_posts_by_cursor(db, s['cursor'], direction="after", limit=21)),
+        ("get_posts_by_cursor before", set(),
+         lambda db: crud.get_posts_by_cursor(db, s['cursor'], direction="before", limit=21)),
+        # Ranking needs a top-N sort over the matching rows
+        ("search_posts", {'Sort'}, lambda db: crud.search_posts(db, "galaxy nebula", limit=21)),
+        ("get_total_posts_count_by_user", set(), lambda db: crud.get_total_posts_count_by_user(db, s['user_id'])),
+        ("get_paginated_posts_by_user", set(),
+         lambda db: crud.get_paginated_posts_by_user(db, s['user_id'], skip=0, limit=15)),
+        ("get_posts_by_user", set(), lambda db: crud.get_posts_by_user(db, s['user_id'])),
+        ("create_post", set(), lambda db: crud.create_post(db, "Plan check post", s['user_id'])),
+        ("get_post_by_id", set(), lambda db: crud.get_post_by_id(db, s['post_id'])),
+        ("update_post", set(), lambda db: crud.update_post(db, s['post_id'], s['user_id'], "Plan check update")),
+        ("delete_post", set(), lambda db: crud.delete_post(db, s['post_id'], s['user_id'])),
+        ("set_users_banned", set(), lambda db: crud.set_users_banned(db, [s['user_id']], banned=True)),
+        ("purge_posts by author", set(), lambda db: crud.purge_posts(db, user_ids=[s['user_id']], limit=500)),
+        ("release_stored_photos", set(), lambda db: crud.release_stored_photos(db, ["0" * 64, "0" * 64])),
+        ("delete_user", set(), lambda db: crud.delete_user(db, s['user_id'])),
+        ("delete_users", set(), lambda db: crud.delete_users(db, [s['user_id'], s['user_id'] + 1])),
+        # Full recount by design
+        ("reconcile_post_counts", {'Seq Scan', 'Sort'}, lambda db: crud.reconcile_post_counts(db)),
+    ]
+
+
+async def run_checks(conn, recorder: StatementRecorder) -> int:
+    samples = await load_samples(conn)
+    failures = 0
+    for name, allowed, check in build_checks(samples):
+        principal_cache.clear()
+        recorder.statements = []
+        async with AsyncSession(bind=conn, join_transaction_mode="create_savepoint",
+                                expire_on_commit=False) as db:
+            recorder.recording = True
+            try:
+                await check(db)
+            finally:
+                recorder.recording = False
+
+        problems = []
+        timings = []
+        for statement, parameters in recorder.statements:
+            if statement.lstrip().upper().startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+                continue
+            plan = await explain(conn, statement, parameters)
+            problems.extend(find_regressions(plan, allowed))
+            if 'Execution Time' in plan:
+                timings.append(plan['Execution Time'])
+
+        timing = f"{sum(timings):.2f} ms" if timings else "not executed"
+        if problems:
+            failures += 1
+            logger.error(f"FAIL {name} ({timing}): {', '.join(problems)}")
+        else:
+            logger.info(f"ok   {name} ({timing})")
+    return failures
+
+
+async def main(args):
+    recorder = StatementRecorder()
+    event.listen(engine.sync_engine, "before_cursor_execute", recorder)
+
+    if args.seed:
+        async with engine.begin() as conn:
+            await seed(conn, args.users, args.posts)
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("ANALYZE"))
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            failures = await run_checks(conn, recorder)
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+
+    if failures:
+        logger.error(f"{failures} query plan regression(s)")
+        return 1
+    logger.info("No query plan regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the query plans of every CRUD function.")
+    parser.add_argument("--seed", action="store_true", help="seed the database at realistic scale first")
+    parser.add_argument("--users", type=int, default=SEED_USERS, help="number of users to seed")
+    parser.add_argument("--posts", type=int, default=SEED_POSTS, help="number of posts to seed")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,125 @@
+import bisect
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Upper bounds, in seconds, of the checkout and connect latency histogram buckets
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _histogram_stats(buckets: tuple, counts: list) -> dict:
+    cumulative = 0
+    histogram = {}
+    for bound, count in zip(buckets + (float('inf'),), counts):
+        cumulative += count
+        histogram['+Inf' if bound == float('inf') else str(bound)] = cumulative
+    return histogram
+
+
+class PoolMetrics:
+    """
+    Checkout wait and connect latency histograms and timeout count of one connection pool
+    of this worker.
+
+    Counters only ever grow, so rates and quantiles can be derived by scraping twice.
+    """
+
+    def __init__(self, buckets: tuple = CHECKOUT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.timeouts = 0
+        self.connect_bucket_counts = [0] * (len(buckets) + 1)
+        self.connects = 0
+        self.connect_seconds = 0.0
+
+    def observe_checkout(self, seconds: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.checkouts += 1
+        self.checkout_seconds += seconds
+
+    def observe_connect(self, seconds: float):
+        self.connect_bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.connects += 1
+        self.connect_seconds += seconds
+
+    def stats(self, pool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "timeouts": self.timeouts,
+            "checkouts": self.checkouts,
+            "checkout_seconds_total": self.checkout_seconds,
+            "checkout_seconds_buckets": _histogram_stats(self.buckets, self.bucket_counts),
+            "connects": self.connects,
+            "connect_seconds_total": self.connect_seconds,
+            "connect_seconds_buckets": _histogram_stats(self.buckets, self.connect_bucket_counts)
+        }
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long every checkout waited for a connection,
+    including timeouts.
+
+    SQLAlchemy has no event for the start of a checkout: the `checkout` pool event only
+    fires once a connection was obtained, so it can neither time the wait nor see a
+    timeout. The wait is therefore timed around the pool's own `_do_get`. Opening a new
+    connection on overflow happens inside that call; its latency is measured with the
+    public `do_connect` and `connect` events (see instrument_connects) and subtracted, so
+    the checkout histogram only holds time spent queueing.
+
+    Every pool has its own PoolMetrics, kept when the engine is disposed and the pool
+    recreated.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self) -> dict:
+        return self.metrics.stats(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            self.metrics.observe_checkout(time.perf_counter() - start)
+            raise
+        waited = time.perf_counter() - start
+        if record.info.get('connected_at', 0) >= start:
+            # Opened by this checkout rather than waited for
+            waited -= record.info['connect_seconds']
+        self.metrics.observe_checkout(max(waited, 0.0))
+        return record
+
+
+def _connect_started(dialect, connection_record, cargs, cparams):
+    connection_record.info['connect_started'] = time.perf_counter()
+
+
+def instrument_connects(sync_engine):
+    """Time every new DBAPI connection of the engine's pool, reconnects included."""
+
+    def connected(dbapi_connection, connection_record):
+        started = connection_record.info.pop('connect_started', None)
+        if started is None:
+            return
+        connected_at = time.perf_counter()
+        connection_record.info['connected_at'] = connected_at
+        connection_record.info['connect_seconds'] = connected_at - started
+        sync_engine.pool.metrics.observe_connect(connected_at - started)
+
+    event.listen(sync_engine, "do_connect", _connect_started)
+    event.listen(sync_engine, "connect", connected)
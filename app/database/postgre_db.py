@@ -1,18 +1,138 @@
+import asyncio
+import itertools
+import time
+from uuid import uuid4
+
+from fastapi import Request
+from loguru import logger
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import (AsyncSession,
-                                    async_sessionmaker,
-                                    create_async_engine)
+                                         async_sessionmaker,
+                                         create_async_engine)
 from sqlalchemy.orm import declarative_base
 
 
-from app.config import DATABASE_URL
+from app.config import (DATABASE_URL,
+                        DB_POOL_SIZE,
+                        DB_MAX_OVERFLOW,
+                        DB_POOL_TIMEOUT,
+                        DB_POOL_RECYCLE,
+                        DB_POOL_PRE_PING,
+                        DB_STATEMENT_CACHE_SIZE,
+                        DB_PGBOUNCER,
+                        READ_REPLICA_URLS,
+                        READ_YOUR_WRITES_SECONDS,
+                        REPLICA_RETRY_SECONDS)
+from app.database.pool import InstrumentedAsyncQueuePool, instrument_connects
+
+if DB_PGBOUNCER:
+    # PgBouncer in transaction mode hands each transaction to any server connection, so
+    # prepared statements must be neither cached nor reused under a fixed name
+    connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__"
+    }
+else:
+    connect_args = {"statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+
+
+def create_db_engine(url: str):
+    db_engine = create_async_engine(url,
+                                    echo=False,
+                                    poolclass=InstrumentedAsyncQueuePool,
+                                    pool_size=DB_POOL_SIZE,
+                                    max_overflow=DB_MAX_OVERFLOW,
+                                    pool_timeout=DB_POOL_TIMEOUT,
+                                    pool_recycle=DB_POOL_RECYCLE,
+                                    pool_pre_ping=DB_POOL_PRE_PING,
+                                    connect_args=connect_args)
+    instrument_connects(db_engine.sync_engine)
+    return db_engine
+
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_db_engine(DATABASE_URL)
+# Every replica gets its own pool of the same size as the primary's
+replica_engines = [create_db_engine(url) for url in READ_REPLICA_URLS]
+# Engines by the name their pools are reported under in /metrics and /admin/stats
+named_engines = [("primary", engine)] + [(f"replica{number}", replica)
+                                         for number, replica in enumerate(replica_engines, 1)]
 
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+
+class ReadReplicas:
+    """
+    Round-robin choice among the replica engines, skipping the ones that are down.
+
+    A replica is only handed out once a connection to it was checked out. One that cannot
+    be connected to is left out for REPLICA_RETRY_SECONDS and the next one is tried; when
+    none is reachable the caller reads from the primary.
+    """
+
+    def __init__(self, engines: list, retry_seconds: int = REPLICA_RETRY_SECONDS):
+        self.sessionmakers = [async_sessionmaker(replica, class_=AsyncSession, expire_on_commit=False)
+                              for replica in engines]
+        self.retry_seconds = retry_seconds
+        self._down_until = [0.0] * len(engines)
+        self._turns = itertools.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.sessionmakers)
+
+    async def session(self) -> AsyncSession | None:
+        for _ in range(len(self.sessionmakers)):
+            index = next(self._turns) % len(self.sessionmakers)
+            if self._down_until[index] > time.monotonic():
+                continue
+            session = self.sessionmakers[index]()
+            try:
+                await session.connection()
+            except (OSError, asyncio.TimeoutError, DBAPIError) as e:
+                await session.close()
+                self._down_until[index] = time.monotonic() + self.retry_seconds
+                logger.warning(f"Read replica {index + 1} is unavailable, "
+                               f"skipping it for {self.retry_seconds}s: {e!r}")
+                continue
+            return session
+        return None
+
+
+read_replicas = ReadReplicas(replica_engines)
+
 Base = declarative_base()
 
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# Session key holding the time until which the user's reads are pinned to the primary
+PRIMARY_PIN_KEY = 'read_primary_until'
+
+
+async def get_session(request: Request) -> AsyncSession:
+    """
+    Session on the primary, for handlers that write or must read their own writes.
 
-async def get_session() -> AsyncSession:
+    A request that may write pins its user to the primary for READ_YOUR_WRITES_SECONDS,
+    so the pages they load next do not come from a replica that has not caught up yet.
+    """
+    if read_replicas and request.method not in SAFE_METHODS:
+        request.session[PRIMARY_PIN_KEY] = time.time() + READ_YOUR_WRITES_SECONDS
     async with async_session() as session:
         yield session
+
+
+async def get_read_session(request: Request) -> AsyncSession:
+    """
+    Session for read-only handlers: a replica, picked round robin, when any are configured.
+
+    Falls back to the primary when there are no replicas, none can be reached, or the user
+    wrote recently.
+    """
+    session = None
+    if read_replicas and request.session.get(PRIMARY_PIN_KEY, 0) <= time.time():
+        session = await read_replicas.session()
+    # Read by the response cache, which does not store fresh replica pages after a write
+    request.state.read_from_replica = session is not None
+    if session is None:
+        session = async_session()
+    async with session:
+        yield session
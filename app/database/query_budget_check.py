@@ -0,0 +1,233 @@
+"""
+Per-route SQL query budget check for app/routers/.
+
+Sends a request to every route of the application with cold principal and response caches,
+counts the SQL statements each request issues and compares them with the route's budget
+in app/tools/query_budget.py. Every request also states the answer it expects: a page, or a
+redirect to a given location. A request over its budget, an unexpected status or redirect
+(which would mean the budget was measured on an error path), a route without a budget and a
+budgeted route that is never exercised all fail the check, and the statements of failing
+requests are printed. Run it with strict loading, so that a lazy load hidden in
+a template fails outright instead of quietly adding a query per row.
+
+Handlers run against the configured database in one transaction that is rolled back at the
+end. The bulk moderation endpoints open their own sessions, so they are called with ids
+that do not exist and change nothing.
+
+Usage:
+    SQL_STRICT_LOADING=true python -m app.database.query_budget_check
+"""
+import asyncio
+import sys
+
+from fastapi.routing import APIRoute
+from httpx import ASGITransport, AsyncClient
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import middleware
+from app.auth.principal_cache import principal_cache
+from app.auth.utils import create_access_token, get_password_hash
+from app.config import SQL_STRICT_LOADING, METRICS_ENABLED, METRICS_TOKEN
+from app.database.plan_check import StatementRecorder
+from app.database.postgre_db import engine, get_session, get_read_session
+from app.main import app
+from app.tools.query_budget import QUERY_BUDGETS
+from app.tools.response_cache import response_cache
+
+FIXTURE_PASSWORD = "query-budget-check"
+FIXTURE_USERS = {
+    "owner": "user",
+    "admin": "admin",
+    "leaving": "user",
+}
+# Ids no row can have, for the endpoints that commit outside the check's transaction
+MISSING_ID = 0
+# Expected answers: (status, redirect location)
+OK = (200, None)
+
+
+def redirect_to(location: str) -> tuple[int, str]:
+    return 302, location
+
+
+async def create_fixtures(conn) -> dict:
+    hashed_password = await get_password_hash(FIXTURE_PASSWORD)
+    fixtures = {}
+    for name, role in FIXTURE_USERS.items():
+        username = f"query_budget_{name}"
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password, role) "
+            "VALUES (:username, :username || '@example.com', :hashed_password, :role) RETURNING id"),
+            {'username': username, 'hashed_password': hashed_password, 'role': role})).scalar_one()
+        await conn.execute(text("INSERT INTO user_profiles (user_id) VALUES (:user_id)"), {'user_id': user_id})
+        fixtures[name] = {'user_id': user_id, 'username': username, 'role': role}
+
+    owner_id = fixtures['owner']['user_id']
+    post_ids = (await conn.execute(text(
+        "INSERT INTO posts (user_id, content, created_at) "
+        "SELECT :user_id, 'Query budget post ' || g || ' about a galaxy', now() - make_interval(secs => g) "
+        "FROM generate_series(1, 30) AS g RETURNING id"), {'user_id': owner_id})).scalars().all()
+    await conn.execute(text("UPDATE users SET post_count = post_count + 30 WHERE id = :user_id"),
+                       {'user_id': owner_id})
+    fixtures['post_id'] = post_ids[0]
+    fixtures['other_post_id'] = post_ids[1]
+    return fixtures
+
+
+def build_requests(f: dict):
+    """
+    (method, route template, path, signed-in fixture user, request kwargs, expected answer),
+    in the order they are sent.
+    """
+    owner_id = f['owner']['user_id']
+    post_id = f['post_id']
+    leaving_id = f['leaving']['user_id']
+    metrics_headers = {'Authorization': f"Bearer {METRICS_TOKEN}"}
+    return [
+        ("GET", "/", "/", None, {}, OK),
+        ("GET", "/", "/", "owner", {}, OK),
+        ("GET", "/register", "/register", None, {}, OK),
+        ("POST", "/register", "/register", None,
+         {'data': {'username': 'query_budget_new', 'email': 'query_budget_new@example.com',
+                   'password': FIXTURE_PASSWORD}}, redirect_to("/")),
+        ("GET", "/login", "/login", None, {}, OK),
+        ("POST", "/login", "/login", None,
+         {'data': {'username': f['owner']['username'], 'password': FIXTURE_PASSWORD}}, redirect_to("/")),
+        ("GET", "/logout", "/logout", "owner", {}, redirect_to("/")),
+        ("GET", "/protected/me", "/protected/me", "owner", {}, redirect_to(f"/protected/profile/{owner_id}")),
+        ("GET", "/protected/profile/{user_id}", f"/protected/profile/{owner_id}", "owner", {}, OK),
+        ("POST", "/protected/profile/{user_id}/update", f"/protected/profile/{owner_id}/update", "admin",
+         {'data': {'first_name': 'Budget', 'role': 'user'}}, redirect_to(f"/protected/profile/{owner_id}")),
+        ("GET", "/posts/all", "/posts/all", "owner", {}, OK),
+        ("GET", "/posts/search", "/posts/search", None, {'params': {'q': 'galaxy'}}, OK),
+        ("GET", "/posts/view/{post_id}", f"/posts/view/{post_id}", None, {}, OK),
+        ("GET", "/posts/new", "/posts/new", "owner", {}, OK),
+        ("POST", "/posts/new", "/posts/new", "owner", {'data': {'content': 'Query budget new post'}},
+         redirect_to("/posts/all")),
+        ("GET", "/posts/edit/{post_id}", f"/posts/edit/{post_id}", "owner", {}, OK),
+        ("POST", "/posts/edit/{post_id}", f"/posts/edit/{post_id}", "owner", {'data': {'content': 'Edited'}},
+         redirect_to("/posts/all")),
+        ("POST", "/posts/delete/{post_id}", f"/posts/delete/{f['other_post_id']}", "owner", {},
+         redirect_to("/posts/all")),
+        ("GET", "/admin/users", "/admin/users", "admin", {'params': {'q': 'query_budget', 'sort': 'posts'}}, OK),
+        ("GET", "/admin/users/{user_id}/posts", f"/admin/users/{owner_id}/posts", "admin", {}, OK),
+        ("GET", "/admin/stats", "/admin/stats", "admin", {}, OK),
+        ("POST", "/admin/users/bulk", "/admin/users/bulk", "admin",
+         {'json': {'action': 'delete', 'user_ids': [MISSING_ID]}}, OK),
+        ("POST", "/admin/posts/purge", "/admin/posts/purge", "admin", {'json': {'post_ids': [MISSING_ID]}}, OK),
+        ("GET", "/media/avatars/{user_id}", f"/media/avatars/{owner_id}", "owner", {}, OK),
+        # Not mounted at all when metrics are turned off or no token is set
+        ("GET", "/metrics", "/metrics", None, {'headers': metrics_headers}, OK if METRICS_ENABLED else (404, None)),
+        ("GET", "/protected/profile/{user_id}/delete", f"/protected/profile/{leaving_id}/delete", "leaving", {},
+         OK),
+        ("POST", "/protected/profile/{user_id}/delete", f"/protected/profile/{leaving_id}/delete", "leaving", {},
+         redirect_to("/logout/?login=True")),
+    ]
+
+
+def missing_budgets() -> list[str]:
+    """Routes of the application that have no query budget."""
+    missing = []
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            for method in sorted(route.methods):
+                if (method, route.path) not in QUERY_BUDGETS:
+                    missing.append(f"{method} {route.path}")
+    return missing
+
+
+def describe(answer: tuple[int, str | None]) -> str:
+    status_code, location = answer
+    return f"status {status_code}" + (f" to {location}" if location else "")
+
+
+async def run_checks(conn, recorder: StatementRecorder) -> int:
+    fixtures = await create_fixtures(conn)
+
+    async def session_in_check_transaction():
+        async with AsyncSession(bind=conn, join_transaction_mode="create_savepoint",
+                                expire_on_commit=False) as db:
+            yield db
+
+    # Replicas could not see the fixtures, so reads go to the check transaction as well,
+    # and so do the principal lookups of the auth middleware
+    app.dependency_overrides[get_session] = session_in_check_transaction
+    app.dependency_overrides[get_read_session] = session_in_check_transaction
+    principal_sessions = middleware.principal_sessions
+    middleware.principal_sessions = lambda: AsyncSession(bind=conn, join_transaction_mode="create_savepoint",
+                                                         expire_on_commit=False)
+
+    failures = 0
+    exercised = set()
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://budget.check") as client:
+        for method, route, path, signed_in, kwargs, expected in build_requests(fixtures):
+            exercised.add((method, route))
+            principal_cache.clear()
+            response_cache.clear()
+            client.cookies.clear()
+            if signed_in:
+                user = fixtures[signed_in]
+                client.cookies.set("access_token",
+                                   create_access_token(user['user_id'], user['username'], user['role']))
+
+            recorder.statements = []
+            recorder.recording = True
+            try:
+                response = await client.request(method, path, **kwargs)
+            finally:
+                recorder.recording = False
+
+            statements = [statement for statement, _ in recorder.statements
+                          if not statement.lstrip().upper().startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK'))]
+            budget = QUERY_BUDGETS.get((method, route))
+            label = f"{method} {path} ({'as ' + signed_in if signed_in else 'anonymous'})"
+            answer = (response.status_code, response.headers.get('location'))
+            if answer != expected or budget is None or len(statements) > budget:
+                failures += 1
+                logger.error(f"FAIL {label}: {describe(answer)}, expected {describe(expected)}, "
+                             f"{len(statements)} statements, budget {budget}")
+                for statement in statements:
+                    logger.error(f"     {' '.join(statement.split())}")
+            else:
+                logger.info(f"ok   {label}: {len(statements)} of {budget} statements")
+
+    app.dependency_overrides.pop(get_session, None)
+    app.dependency_overrides.pop(get_read_session, None)
+    middleware.principal_sessions = principal_sessions
+
+    for route in missing_budgets():
+        failures += 1
+        logger.error(f"FAIL {route}: no query budget")
+    for method, route in sorted(set(QUERY_BUDGETS) - exercised):
+        failures += 1
+        logger.error(f"FAIL {method} {route}: budget is never checked")
+    return failures
+
+
+async def main():
+    if not SQL_STRICT_LOADING:
+        logger.warning("SQL_STRICT_LOADING is off: lazy loads are counted but do not fail")
+
+    recorder = StatementRecorder()
+    event.listen(engine.sync_engine, "before_cursor_execute", recorder)
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            failures = await run_checks(conn, recorder)
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+
+    if failures:
+        logger.error(f"{failures} query budget failure(s)")
+        return 1
+    logger.info("Every route is within its query budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,23 @@
+"""
+Repair drift in the maintained post counters.
+
+Usage:
+    python -m app.database.reconcile
+"""
+import asyncio
+
+from loguru import logger
+
+from app.database.crud import reconcile_post_counts
+from app.database.postgre_db import async_session, engine
+
+
+async def main():
+    async with async_session() as db:
+        drifted_users, total = await reconcile_post_counts(db)
+    await engine.dispose()
+    logger.info(f"Post counters reconciled: {drifted_users} user(s) corrected, {total} post(s) in total")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,4 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
@@ -7,18 +6,32 @@ from contextlib import asynccontextmanager
 from alembic.config import Config
 
 from app.auth.middleware import check_access_token
-from app.config import SECRET_KEY, BASE_DIR, DATABASE_URL
+from app.config import SECRET_KEY, BASE_DIR, DATABASE_URL, METRICS_ENABLED, QUERY_BUDGET_WARNINGS
 from app.routers.admin import router as admin_router
 from app.routers.login import router as login_router
+from app.routers.media import router as media_router
+from app.routers.metrics import router as metrics_router
 from app.routers.posts import router as posts_router
 from app.routers.profile import router as profile_router
 from app.routers.register import router as register_router
 from app.routers.root import router as root_router
+from app.tools.compression import CompressionMiddleware, PrecompressedStaticFiles
+from app.tools.invalidation import invalidation_bus
+from app.tools.metrics import MetricsMiddleware, metrics_snapshots
+from app.tools.unsplash import unsplash_pool
+from app.tools.upload_limit import UploadLimitMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Runs in every worker process, after the fork
+    await unsplash_pool.start()
+    await invalidation_bus.start()
+    await metrics_snapshots.start()
     yield
+    await metrics_snapshots.stop()
+    await invalidation_bus.stop()
+    await unsplash_pool.stop()
 
 
 app = FastAPI(
@@ -51,6 +64,8 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Inside the session middleware, so an oversized upload can be answered with a flash message
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
 app.add_middleware(
     CORSMiddleware,
@@ -60,9 +75,13 @@ app.add_middleware(
     allow_headers=["*"]
 )
 app.middleware("http")(check_access_token)
+app.add_middleware(CompressionMiddleware)
+if METRICS_ENABLED or QUERY_BUDGET_WARNINGS:
+    # Added last so that it wraps every other middleware
+    app.add_middleware(MetricsMiddleware)
 
 templates = Jinja2Templates(directory=f"{BASE_DIR}/templates")
-app.mount("/static", StaticFiles(directory=f"{BASE_DIR}/static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=f"{BASE_DIR}/static"), name="static")
 
 alembic_config = Config('alembic.ini')
 alembic_config.set_main_option('sqlalchemy.url', DATABASE_URL)
@@ -73,3 +92,6 @@ app.include_router(login_router)
 app.include_router(profile_router)
 app.include_router(posts_router)
 app.include_router(admin_router)
+app.include_router(media_router)
+if METRICS_ENABLED:
+    app.include_router(metrics_router)
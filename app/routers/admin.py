@@ -1,52 +1,87 @@
 # admin.py
-from fastapi import APIRouter, Depends, Request, Query
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Depends, Request, Query, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.middleware import check_user
-from app.auth.schemas import TokenData
-from app.database.crud import get_all_users, get_paginated_posts_by_user, get_total_posts_count_by_user
-from app.database.postgre_db import get_session
-from app.tools.functions import redirect_with_message
+from app.auth.principal_cache import principal_cache
+from app.auth.schemas import TokenData, BulkUserAction, PostPurge
+from app.database.crud import get_users_page, get_paginated_posts_by_user, get_total_posts_count_by_user
+from app.database.postgre_db import named_engines, get_session, get_read_session
+from app.tools.functions import redirect_with_message, encode_int_cursor, decode_int_cursor
+from app.tools.invalidation import invalidation_bus
+from app.tools.moderation import bulk_user_action, bulk_purge_posts
+from app.tools.response_cache import cached, response_cache
+from app.tools.templating import InstrumentedTemplates, StreamingTemplateResponse
 from templates.icons import WARNING_ICON, WARNING_CLASS
 
 router = APIRouter(tags=['admin'], prefix='/admin')
-templates = Jinja2Templates(directory="templates")
+templates = InstrumentedTemplates(directory="templates")
 
 
-@router.get("/users", description="Retrieve a list of all users for admin view.")
+@router.get("/users", description="Retrieve a paginated, searchable list of users for admin view.")
 async def admin_users(request: Request,
-                      db: AsyncSession = Depends(get_session),
-                      user: TokenData = Depends(check_user)):
+                      db: AsyncSession = Depends(get_read_session),
+                      user: TokenData = Depends(check_user),
+                      q: str = Query("", description="Username or email to search for"),
+                      match: str = Query("contains", pattern="^(contains|prefix)$",
+                                         description="Match the search anywhere or as a prefix"),
+                      sort: str = Query("id", pattern="^(id|posts)$", description="Sort by id or by post count"),
+                      after: str | None = Query(None, description="Cursor of the last user on the previous page"),
+                      page_size: int = Query(50, ge=1, le=500, description="Number of users per page")):
     """
-    Retrieve a list of all users for admin view.
+    Retrieve a paginated, searchable list of users for admin view.
 
     Args:
         request (Request): The request object.
         db (AsyncSession): The database session.
         user (TokenData): The authenticated user data.
+        q (str): Username or email to search for.
+        match (str): "contains" to match anywhere, "prefix" to match the beginning.
+        sort (str): "id" for oldest accounts first, "posts" for most posts first.
+        after (str): Keyset cursor to continue the list after.
+        page_size (int): The number of users per page.
 
     Returns:
-        TemplateResponse: The rendered HTML template with the list of users.
+        StreamingTemplateResponse: The list of users, streamed as it is rendered.
     """
-    if user['role'] != 'admin':
+    if not user or user['role'] != 'admin':
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
                                            message_text="You are not authorized to view this page.",
                                            endpoint="/")
 
-    users = await get_all_users(db)
-    return templates.TemplateResponse("admin/users.html", {"request": request, "users": users, "user": user})
+    q = q.strip()
+    cursor = decode_int_cursor(after, 2 if sort == "posts" else 1)
+    users = await get_users_page(db, search=q or None, match=match, sort=sort, cursor=cursor, limit=page_size)
+
+    next_cursor = None
+    if len(users) == page_size:
+        last = users[-1]
+        next_cursor = encode_int_cursor(last.post_count, last.id) if sort == "posts" else encode_int_cursor(last.id)
+
+    return StreamingTemplateResponse("admin/users.html", {
+        "request": request,
+        "users": users,
+        "user": user,
+        "q": q,
+        "match": match,
+        "sort": sort,
+        "page_size": page_size,
+        "is_first_page": cursor is None,
+        "next_cursor": next_cursor
+    })
 
 
 @router.get("/users/{user_id}/posts", description="Retrieve posts by a specific user for admin view.")
+@cached(tags=lambda kwargs, response: (f"user_posts:{kwargs['user_id']}",))
 async def admin_user_posts(request: Request,
                            user_id: int,
                            db: AsyncSession = Depends(get_session),
                            user: TokenData = Depends(check_user),
-                           page: int = Query(1, description="Page number"),
-                           page_size: int = Query(15, description="Number of posts per page")):
+                           page: int = Query(1, ge=1, description="Page number"),
+                           page_size: int = Query(15, ge=1, le=100, description="Number of posts per page")):
     """
     Retrieve posts by a specific user for admin view.
 
@@ -61,7 +96,7 @@ async def admin_user_posts(request: Request,
     Returns:
         TemplateResponse: The rendered HTML template with the user's posts.
     """
-    if user['role'] != 'admin':
+    if not user or user['role'] != 'admin':
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
@@ -83,3 +118,65 @@ async def admin_user_posts(request: Request,
         "total_pages": total_pages,
         "page_size": page_size
     })
+
+
+@router.get("/stats", description="Return in-process cache and connection pool statistics for capacity planning.")
+async def admin_stats(user: TokenData = Depends(check_user)):
+    """
+    Return in-process cache and connection pool statistics for capacity planning.
+
+    Args:
+        user (TokenData): The authenticated user data.
+
+    Returns:
+        dict: Size and hit rate of the in-process caches and the database pool state of this worker.
+    """
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+    return {"principal_cache": principal_cache.stats(),
+            "response_cache": response_cache.stats(),
+            "db_pools": {name: db_engine.pool.stats() for name, db_engine in named_engines},
+            "cache_invalidation": invalidation_bus.stats()}
+
+
+@router.post("/users/bulk", description="Delete, ban or unban many users, streaming progress as NDJSON.")
+async def admin_bulk_users(payload: BulkUserAction, user: TokenData = Depends(check_user)):
+    """
+    Delete, ban or unban many users, streaming progress as NDJSON.
+
+    Args:
+        payload (BulkUserAction): The action and the ids of the users.
+        user (TokenData): The authenticated user data.
+
+    Returns:
+        StreamingResponse: One JSON progress line per chunk of users.
+    """
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+    # An admin never bans or deletes their own account in bulk
+    user_ids = [user_id for user_id in payload.user_ids if user_id != user['user_id']]
+    return StreamingResponse(bulk_user_action(payload.action, user_ids), media_type="application/x-ndjson")
+
+
+@router.post("/posts/purge", description="Delete many posts by id or by author, streaming progress as NDJSON.")
+async def admin_purge_posts(payload: PostPurge, user: TokenData = Depends(check_user)):
+    """
+    Delete many posts by id or by author, streaming progress as NDJSON.
+
+    Args:
+        payload (PostPurge): Either the ids of the posts or the ids of their authors.
+        user (TokenData): The authenticated user data.
+
+    Returns:
+        StreamingResponse: One JSON progress line per chunk of posts.
+    """
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+    if (payload.post_ids is None) == (payload.user_ids is None):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Give either post_ids or user_ids")
+
+    return StreamingResponse(bulk_purge_posts(post_ids=payload.post_ids, user_ids=payload.user_ids),
+                             media_type="application/x-ndjson")
@@ -5,7 +5,6 @@ from fastapi import (APIRouter,
                      Request)
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.middleware import check_user
@@ -15,11 +14,12 @@ from app.auth.utils import (authenticated_root_redirect,
 from app.database.crud import (authenticate_user)
 from app.database.postgre_db import get_session
 from app.tools.functions import redirect_with_message
+from app.tools.templating import InstrumentedTemplates
 from templates.icons import WARNING_ICON, WARNING_CLASS
 
 router = APIRouter(tags=['user login'])
 
-templates = Jinja2Templates(directory="templates")
+templates = InstrumentedTemplates(directory="templates")
 
 
 @router.get("/login", response_class=HTMLResponse, description="Display the login form.")
@@ -71,7 +71,7 @@ async def login_for_access_token(request: Request,
                                            message_text="Incorrect username or password",
                                            logout=True
                                            )
-    return await authenticated_root_redirect(request, user.username, user.role)  # Pass role as string
+    return await authenticated_root_redirect(request, user.id, user.username, user.role)  # Pass role as string
 
 
 @router.get("/logout", description="Logout the user and redirect to the login page.")
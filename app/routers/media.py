@@ -0,0 +1,61 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.middleware import check_user
+from app.auth.schemas import TokenData
+from app.config import BASE_DIR
+from app.database.crud import get_user_profile
+from app.database.postgre_db import get_session
+from app.tools.functions import file_response_with_validators
+from app.tools.images import choose_avatar_variant
+
+router = APIRouter(tags=['media'], prefix='/media')
+
+DEFAULT_AVATAR_PATH = os.path.join(BASE_DIR, 'static', 'img', 'default_avatar.jpg')
+
+# Avatars are only shown to signed-in users, like the profiles they belong to, so only the
+# browser may keep them. Versioned URLs (?v=...) change whenever the photo changes, so they
+# can be cached forever
+VERSIONED_CACHE_CONTROL = "private, max-age=31536000, immutable"
+UNVERSIONED_CACHE_CONTROL = "private, max-age=300"
+
+
+@router.get("/avatars/{user_id}", description="Serve the user's avatar image.")
+async def get_avatar(request: Request,
+                     user_id: int,
+                     size: int | None = Query(None, description="Rendered width in pixels"),
+                     db: AsyncSession = Depends(get_session),
+                     user: TokenData | None = Depends(check_user)):
+    """
+    Serve the user's avatar image.
+
+    Args:
+        request (Request): The request object.
+        user_id (int): The ID of the user whose avatar is requested.
+        size (int): The rendered width, used to pick the smallest sufficient variant.
+        db (AsyncSession): The database session.
+        user (TokenData): The authenticated user data.
+
+    Returns:
+        FileResponse: The avatar file, the default avatar, or 304 Not Modified.
+    """
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+    profile = await get_user_profile(db, user_id)
+    if profile and profile.user_photo_variants:
+        photo_path = choose_avatar_variant(profile.user_photo_variants, size, request.headers.get('accept', ''))
+    elif profile and profile.user_photo:
+        photo_path = profile.user_photo
+    else:
+        photo_path = DEFAULT_AVATAR_PATH
+    if not os.path.exists(photo_path):
+        photo_path = DEFAULT_AVATAR_PATH
+
+    if 'v' in request.query_params:
+        cache_control = VERSIONED_CACHE_CONTROL
+    else:
+        cache_control = UNVERSIONED_CACHE_CONTROL
+    return file_response_with_validators(request, photo_path, cache_control, vary="Accept")
@@ -0,0 +1,26 @@
+import hmac
+
+from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import Response
+
+from app.config import METRICS_TOKEN
+from app.tools.metrics import render_metrics, CONTENT_TYPE
+
+router = APIRouter(tags=['metrics'])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Expose the metrics of this worker in the Prometheus text format.
+
+    Args:
+        request (Request): The request object.
+
+    Returns:
+        Response: Request latency, SQL time, template and Unsplash timings and pool state.
+    """
+    supplied = request.headers.get('authorization', '')
+    if not METRICS_TOKEN or not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
@@ -1,22 +1,25 @@
 from fastapi import APIRouter, Depends, Request, Query
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.middleware import check_user
 from app.auth.schemas import TokenData
-from app.database.crud import (get_user_by_username,
+from app.database.crud import (search_posts,
                                get_paginated_posts_by_user,
                                get_total_posts_count_by_user,
                                create_post,
                                get_post_by_id,
                                update_post,
-                               delete_post)
-from app.database.postgre_db import get_session
-from app.tools.functions import redirect_with_message
+                               delete_post,
+                               MutationResult)
+from app.database.postgre_db import get_session, get_read_session
+from app.tools.etag import conditional
+from app.tools.functions import redirect_with_message, encode_rank_cursor, decode_rank_cursor
+from app.tools.response_cache import cached
+from app.tools.templating import InstrumentedTemplates
 from templates.icons import WARNING_ICON, WARNING_CLASS, OK_ICON, OK_CLASS
 
 router = APIRouter(tags=['posts'])
-templates = Jinja2Templates(directory="templates")
+templates = InstrumentedTemplates(directory="templates")
 
 
 async def handle_top_message(request: Request):
@@ -27,11 +30,13 @@ async def handle_top_message(request: Request):
 
 
 @router.get('/posts/all', description="Retrieve all posts for the authenticated user.")
+@cached(tags=lambda kwargs, response: (f"user_posts:{kwargs['user']['user_id']}",))
+@conditional
 async def my_posts(request: Request,
-                   db: AsyncSession = Depends(get_session),
+                   db: AsyncSession = Depends(get_read_session),
                    user: TokenData = Depends(check_user),
-                   page: int = Query(1, description="Page number"),
-                   page_size: int = Query(21, description="Number of posts per page")):
+                   page: int = Query(1, ge=1, description="Page number"),
+                   page_size: int = Query(21, ge=1, le=100, description="Number of posts per page")):
     """
     Retrieve all posts for the authenticated user.
 
@@ -45,15 +50,13 @@ async def my_posts(request: Request,
     Returns:
         TemplateResponse: The rendered HTML template with the user's posts.
     """
-    username = user['username']
-    user_obj = await get_user_by_username(db, username)
-    if user_obj is None:
+    if user is None:
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
                                            message_text="User not found",
-                                           endpoint="/")
-    user_id = user_obj.id
+                                           endpoint="/login")
+    user_id = user['user_id']
     skip = (page - 1) * page_size
     limit = page_size
 
@@ -73,8 +76,55 @@ async def my_posts(request: Request,
     })
 
 
+@router.get('/posts/search', description="Search posts by their content.")
+@conditional
+async def search_posts_route(request: Request,
+                             db: AsyncSession = Depends(get_read_session),
+                             user: TokenData | None = Depends(check_user),
+                             q: str = Query("", description="Search query"),
+                             after: str | None = Query(None, description="Cursor of the last result on the previous page"),
+                             page_size: int = Query(21, ge=1, le=100, description="Number of posts per page")):
+    """
+    Search posts by their content.
+
+    Args:
+        request (Request): The request object.
+        db (AsyncSession): The database session.
+        user (TokenData): The authenticated user data.
+        q (str): The search query, in web search syntax ("quoted phrases", -excluded, or).
+        after (str): Keyset cursor to continue the results after.
+        page_size (int): The number of posts per page.
+
+    Returns:
+        TemplateResponse: The rendered HTML template with the ranked results.
+    """
+    q = q.strip()
+    results = []
+    if q:
+        results = await search_posts(db, q, cursor=decode_rank_cursor(after), limit=page_size)
+
+    next_cursor = None
+    if len(results) == page_size:
+        last_post, last_rank = results[-1]
+        next_cursor = encode_rank_cursor(last_rank, last_post.id)
+
+    top_message = await handle_top_message(request)
+    return templates.TemplateResponse("posts/search.html", {
+        "request": request,
+        "user": user,
+        "top_message": top_message,
+        "q": q,
+        "posts": [post for post, _ in results],
+        "page_size": page_size,
+        "next_cursor": next_cursor
+    })
+
+
 @router.get('/posts/view/{post_id}', description="View a specific post by ID.")
-async def view_post(request: Request, post_id: int, db: AsyncSession = Depends(get_session),
+@cached(tags=lambda kwargs, response: (f"post:{kwargs['post_id']}",
+                                      f"user_posts:{response.context['post'].user_id}"))
+@conditional
+async def view_post(request: Request, post_id: int, db: AsyncSession = Depends(get_read_session),
                     user: TokenData = Depends(check_user)):
     """
     View a specific post by ID.
@@ -116,6 +166,12 @@ async def create_post_form(request: Request, user: TokenData = Depends(check_use
     Returns:
         TemplateResponse: The rendered HTML template for the new post form.
     """
+    if user is None:
+        return await redirect_with_message(request=request,
+                                           message_class=WARNING_CLASS,
+                                           message_icon=WARNING_ICON,
+                                           message_text="User not found",
+                                           endpoint="/login")
     top_message = await handle_top_message(request)
     return templates.TemplateResponse("user/create_post.html", {
         "request": request,
@@ -146,15 +202,13 @@ async def create_post_route(request: Request, db: AsyncSession = Depends(get_ses
                                            message_icon=WARNING_ICON,
                                            message_text="Content is required",
                                            endpoint="/posts/new")
-    username = user['username']
-    user_obj = await get_user_by_username(db, username)
-    if user_obj is None:
+    if user is None:
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
                                            message_text="User not found",
                                            endpoint="/")
-    user_id = user_obj.id
+    user_id = user['user_id']
     post = await create_post(db, content, user_id)
     return await redirect_with_message(request=request,
                                        message_class=OK_CLASS,
@@ -178,6 +232,12 @@ async def edit_post_form(request: Request, post_id: int, db: AsyncSession = Depe
     Returns:
         TemplateResponse: The rendered HTML template for the edit post form.
     """
+    if user is None:
+        return await redirect_with_message(request=request,
+                                           message_class=WARNING_CLASS,
+                                           message_icon=WARNING_ICON,
+                                           message_text="User not found",
+                                           endpoint="/login")
     post = await get_post_by_id(db, post_id)
     if not post:
         return await redirect_with_message(request=request,
@@ -185,15 +245,7 @@ async def edit_post_form(request: Request, post_id: int, db: AsyncSession = Depe
                                            message_icon=WARNING_ICON,
                                            message_text="Post not found",
                                            endpoint="/posts/all")
-    username = user['username']
-    user_obj = await get_user_by_username(db, username)
-    if user_obj is None:
-        return await redirect_with_message(request=request,
-                                           message_class=WARNING_CLASS,
-                                           message_icon=WARNING_ICON,
-                                           message_text="User not found",
-                                           endpoint="/")
-    user_id = user_obj.id
+    user_id = user['user_id']
     if post.user_id != user_id:
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
@@ -224,28 +276,12 @@ async def edit_post_route(request: Request, post_id: int, db: AsyncSession = Dep
     Returns:
         RedirectResponse: Redirect to the posts list after updating the post.
     """
-    post = await get_post_by_id(db, post_id)
-    if not post:
-        return await redirect_with_message(request=request,
-                                           message_class=WARNING_CLASS,
-                                           message_icon=WARNING_ICON,
-                                           message_text="Post not found",
-                                           endpoint="/posts/all")
-    username = user['username']
-    user_obj = await get_user_by_username(db, username)
-    if user_obj is None:
+    if user is None:
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
                                            message_text="User not found",
-                                           endpoint="/")
-    user_id = user_obj.id
-    if post.user_id != user_id:
-        return await redirect_with_message(request=request,
-                                           message_class=WARNING_CLASS,
-                                           message_icon=WARNING_ICON,
-                                           message_text="You do not have permission to edit this post",
-                                           endpoint="/posts/all")
+                                           endpoint="/login")
     form = await request.form()
     content = form.get("content")
     if not content:
@@ -254,7 +290,15 @@ async def edit_post_route(request: Request, post_id: int, db: AsyncSession = Dep
                                            message_icon=WARNING_ICON,
                                            message_text="Content is required",
                                            endpoint=f"/posts/edit/{post_id}")
-    post = await update_post(db, post_id, content)
+    result = await update_post(db, post_id, user['user_id'], content)
+    if result is not MutationResult.OK:
+        message_text = ("Post not found" if result is MutationResult.NOT_FOUND
+                        else "You do not have permission to edit this post")
+        return await redirect_with_message(request=request,
+                                           message_class=WARNING_CLASS,
+                                           message_icon=WARNING_ICON,
+                                           message_text=message_text,
+                                           endpoint="/posts/all")
     return await redirect_with_message(request=request,
                                        message_class=OK_CLASS,
                                        message_icon=OK_ICON,
@@ -277,29 +321,21 @@ async def delete_post_route(request: Request, post_id: int, db: AsyncSession = D
     Returns:
         RedirectResponse: Redirect to the posts list after deleting the post.
     """
-    post = await get_post_by_id(db, post_id)
-    if not post:
-        return await redirect_with_message(request=request,
-                                           message_class=WARNING_CLASS,
-                                           message_icon=WARNING_ICON,
-                                           message_text="Post not found",
-                                           endpoint="/posts/all")
-    username = user['username']
-    user_obj = await get_user_by_username(db, username)
-    if user_obj is None:
+    if user is None:
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
                                            message_text="User not found",
-                                           endpoint="/")
-    user_id = user_obj.id
-    if post.user_id != user_id:
+                                           endpoint="/login")
+    result = await delete_post(db, post_id, user['user_id'])
+    if result is not MutationResult.OK:
+        message_text = ("Post not found" if result is MutationResult.NOT_FOUND
+                        else "You do not have permission to delete this post")
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
                                            message_icon=WARNING_ICON,
-                                           message_text="You do not have permission to delete this post",
+                                           message_text=message_text,
                                            endpoint="/posts/all")
-    await delete_post(db, post_id)
     return await redirect_with_message(request=request,
                                        message_class=OK_CLASS,
                                        message_icon=OK_ICON,
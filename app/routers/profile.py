@@ -3,30 +3,34 @@ from typing import Optional
 
 from fastapi import (APIRouter,
                      Depends,
+                     HTTPException,
                      status,
                      Request,
                      Form,
                      UploadFile,
                      File)
 from fastapi.responses import RedirectResponse, HTMLResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.middleware import check_user
+from app.auth.principal_cache import principal_cache
 from app.auth.schemas import TokenData, UserProfileUpdate
 from app.config import IMAGE_DIR
 from app.database.crud import (get_user,
                                get_user_profile,
-                               get_user_by_username,
                                update_user_profile,
+                               release_stored_photo,
                                delete_user)
-from app.database.postgre_db import get_session
-from app.tools.functions import read_and_encode_photo, save_file_with_uuid
+from app.database.postgre_db import get_session, get_read_session
+from app.tools.images import largest_avatar_path, remove_avatar_files
+from app.tools.photo_storage import PreparedAvatar, prepare_avatar, store_avatar, remove_released_photos
+from app.tools.response_cache import response_cache
 from app.tools.functions import redirect_with_message
+from app.tools.templating import InstrumentedTemplates
 from templates.icons import WARNING_ICON, WARNING_CLASS, OK_ICON, OK_CLASS, USER_DELETE_ICON
 
 router = APIRouter(tags=['user profile'], prefix='/protected')
-templates = Jinja2Templates(directory="templates")
+templates = InstrumentedTemplates(directory="templates")
 
 
 @router.get("/me", description="Redirect to the user's profile page.")
@@ -44,10 +48,8 @@ async def get_me(request: Request,
     Returns:
         RedirectResponse: Redirect to the user's profile page.
     """
-    user_profile = await get_user_by_username(db, user['username'])
-    if user_profile:
-        user_id = user_profile.id
-        return RedirectResponse(f"/protected/profile/{user_id}",
+    if user:
+        return RedirectResponse(f"/protected/profile/{user['user_id']}",
                                 status_code=status.HTTP_302_FOUND
                                 )
     else:
@@ -62,7 +64,7 @@ async def get_me(request: Request,
 @router.get("/profile/{user_id}", description="Display the user's profile page.")
 async def get_profile(request: Request,
                       user_id: int,
-                      db: AsyncSession = Depends(get_session),
+                      db: AsyncSession = Depends(get_read_session),
                       user: TokenData | None = Depends(check_user)
                       ):
     """
@@ -114,17 +116,9 @@ async def get_profile(request: Request,
 
     profile.update(profile_addon)
 
-    default_avatar_path = "static/img/default_avatar.jpg"
-    if result_profile.user_photo and os.path.exists(result_profile.user_photo):
-        user_photo_base64 = await read_and_encode_photo(result_profile.user_photo)
-        if user_photo_base64:
-            profile['user_photo'] = user_photo_base64
-        else:
-            default_avatar_base64 = await read_and_encode_photo(default_avatar_path)
-            profile['user_photo'] = default_avatar_base64
-    else:
-        default_avatar_base64 = await read_and_encode_photo(default_avatar_path)
-        profile['user_photo'] = default_avatar_base64
+    # The avatar itself is served by /media/avatars/{user_id}, the version only busts browser caches
+    photo_version = os.path.basename(result_profile.user_photo) if result_profile.user_photo else 'default'
+    profile['user_photo'] = f"/media/avatars/{result_user.id}?v={photo_version}"
 
     return templates.TemplateResponse("user/profile.html",
                                       {"request": request,
@@ -165,6 +159,45 @@ async def update_profile(request: Request,
     Returns:
         RedirectResponse: Redirect to the user's profile page after updating.
     """
+    if current_user is None:
+        return await redirect_with_message(request=request,
+                                           message_class=WARNING_CLASS,
+                                           message_icon=WARNING_ICON,
+                                           message_text="User not found",
+                                           logout=True
+                                           )
+
+    # The upload is decoded before the session is first used, so no connection waits on it
+    prepared_photo = None
+    if user_photo and user_photo.filename:
+        if user_photo.content_type not in ['image/jpeg', 'image/png']:
+            return await redirect_with_message(request=request,
+                                               message_class=WARNING_CLASS,
+                                               message_icon=WARNING_ICON,
+                                               message_text="File must be an image!",
+                                               endpoint=f"/protected/profile/{user_id}"
+                                               )
+        try:
+            prepared_photo = await prepare_avatar(user_photo, IMAGE_DIR)
+        except HTTPException as e:
+            return await redirect_with_message(request=request,
+                                               message_class=WARNING_CLASS,
+                                               message_icon=WARNING_ICON,
+                                               message_text=e.detail,
+                                               endpoint=f"/protected/profile/{user_id}"
+                                               )
+
+    try:
+        return await _update_profile(request, user_id, first_name, last_name, phone_number, prepared_photo,
+                                     user_age, role, db, current_user)
+    finally:
+        if prepared_photo:
+            prepared_photo.discard()
+
+
+async def _update_profile(request: Request, user_id: int, first_name: str | None, last_name: str | None,
+                          phone_number: str | None, prepared_photo: PreparedAvatar | None, user_age: str | None,
+                          role: str | None, db: AsyncSession, current_user: TokenData):
     user = await get_user(db, user_id)
     user_profile = await get_user_profile(db, user_id)
     if not user_profile:
@@ -176,19 +209,28 @@ async def update_profile(request: Request,
                                            )
 
     previous_photo_path = user_profile.user_photo
-    if user_photo and user_photo.filename:
-        if user_photo.content_type not in ['image/jpeg', 'image/png']:
+    previous_photo_variants = user_profile.user_photo_variants
+    previous_photo_hash = user_profile.user_photo_hash
+    photo_variants = None
+    photo_hash = None
+    released_variants = None
+    if prepared_photo:
+        try:
+            photo_hash, photo_variants = await store_avatar(db, prepared_photo)
+        except HTTPException as e:
             return await redirect_with_message(request=request,
                                                message_class=WARNING_CLASS,
                                                message_icon=WARNING_ICON,
-                                               message_text="File must be an image!",
+                                               message_text=e.detail,
                                                endpoint=f"/protected/profile/{user_id}"
                                                )
+        file_location = largest_avatar_path(photo_variants)
 
-        file_location = await save_file_with_uuid(user_photo, IMAGE_DIR)
-
-        if previous_photo_path and os.path.exists(previous_photo_path):
-            os.remove(previous_photo_path)
+        if previous_photo_hash:
+            released_variants = await release_stored_photo(db, previous_photo_hash)
+        else:
+            # Photos uploaded before content-addressed storage are owned by a single profile
+            remove_avatar_files(previous_photo_path, previous_photo_variants)
     else:
         file_location = previous_photo_path
 
@@ -197,6 +239,8 @@ async def update_profile(request: Request,
                                          last_name=last_name,
                                          phone_number=phone_number,
                                          user_photo=file_location,
+                                         user_photo_variants=photo_variants,
+                                         user_photo_hash=photo_hash,
                                          user_age=user_age,
                                          role=role)
     else:
@@ -204,14 +248,20 @@ async def update_profile(request: Request,
                                          last_name=last_name,
                                          phone_number=phone_number,
                                          user_photo=file_location,
+                                         user_photo_variants=photo_variants,
+                                         user_photo_hash=photo_hash,
                                          user_age=user_age)
 
     await update_user_profile(db, user_id, user_profile)
+    if released_variants:
+        await remove_released_photos([(previous_photo_hash, released_variants)])
 
     if role and current_user['role'] == 'admin':
         user.role = role
         await db.commit()
         await db.refresh(user)
+        principal_cache.invalidate(user_id)
+        response_cache.invalidate_tags(f"user:{user_id}")
 
     if current_user['role'] == 'admin':
         endpoint = f"/protected/profile/{user_id}"
@@ -243,8 +293,14 @@ async def confirm_delete(request: Request,
     Returns:
         TemplateResponse: The rendered HTML template for the confirmation page.
     """
-    current_user = await get_user_by_username(db, user['username'])
-    current_user_id = current_user.id if current_user else None
+    if not user:
+        return await redirect_with_message(request=request,
+                                           message_class=WARNING_CLASS,
+                                           message_icon=WARNING_ICON,
+                                           message_text="User not found",
+                                           logout=True
+                                           )
+    current_user_id = user['user_id']
 
     return templates.TemplateResponse("user/confirm_delete.html",
                                       {"request": request,
@@ -280,11 +336,18 @@ async def delete_user_profile(user_id: int,
                                            logout=True
                                            )
 
-    previous_photo_path = user_profile.user_photo
+    photo_hash = user_profile.user_photo_hash
+    released_variants = None
+    if photo_hash:
+        # The reference is dropped in the same transaction as the user
+        released_variants = await release_stored_photo(db, photo_hash)
 
     if await delete_user(db, user_id):
-        if previous_photo_path and os.path.exists(previous_photo_path):
-            os.remove(previous_photo_path)
+        if photo_hash:
+            if released_variants:
+                await remove_released_photos([(photo_hash, released_variants)])
+        else:
+            remove_avatar_files(user_profile.user_photo, user_profile.user_photo_variants)
 
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
@@ -5,20 +5,19 @@ from fastapi import (APIRouter,
                      Depends,
                      Request)
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.schemas import UserCreate, TokenData, User
 from app.auth.utils import authenticated_root_redirect
-from app.database.crud import (create_user,
-                               check_user_exists)
+from app.database.crud import create_user
 from app.database.postgre_db import get_session
 from app.routers.login import check_user
 from app.tools.functions import redirect_with_message
+from app.tools.templating import InstrumentedTemplates
 from templates.icons import WARNING_ICON, WARNING_CLASS, USER_REGISTER_ICON
 
 router = APIRouter(tags=['user register'])
-templates = Jinja2Templates(directory="templates")
+templates = InstrumentedTemplates(directory="templates")
 
 
 @router.get('/register', response_class=HTMLResponse, description="Display the registration form.")
@@ -67,7 +66,8 @@ async def register_user(request: Request,
     Returns:
         RedirectResponse: Redirect to the root page after successful registration.
     """
-    existing_user_check = await check_user_exists(db, username=username, email=email)
+    user = UserCreate(username=username, email=email, password=password, role="user")
+    new_user_id, existing_user_check = await create_user(db=db, user=user)
     if existing_user_check == "username":
         return await redirect_with_message(request=request,
                                            message_class=WARNING_CLASS,
@@ -90,12 +90,10 @@ async def register_user(request: Request,
                                            endpoint="/register"
                                            )
 
-    user = UserCreate(username=username, email=email, password=password, role="user")
-    await create_user(db=db, user=user)
     new_top_message = {
         "class": "alert alert-info rounded",
         "icon": USER_REGISTER_ICON,
         "text": f"User {username} has been created"
     }
     request.session['top_message'] = new_top_message
-    return await authenticated_root_redirect(request, user.username, role="user")
+    return await authenticated_root_redirect(request, new_user_id, user.username, role="user")
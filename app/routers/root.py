@@ -1,25 +1,43 @@
 # root.py
 from fastapi import APIRouter, Depends, Request, Query
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.middleware import check_user
 from app.auth.schemas import TokenData
-from app.database.crud import get_paginated_posts, get_total_posts_count
-from app.database.postgre_db import get_session
-from app.tools.functions import load_unsplash_photo
+from app.database.crud import get_paginated_posts, get_posts_by_cursor, get_total_posts_count
+from app.database.postgre_db import get_read_session
+from app.tools.etag import conditional
+from app.tools.functions import encode_cursor, decode_cursor
+from app.tools.response_cache import cached
+from app.tools.templating import StreamingTemplateResponse
+from app.tools.unsplash import unsplash_pool
 from templates.icons import HI_ICON
 
 router = APIRouter(tags=['root'])
-templates = Jinja2Templates(directory="templates")
+
+
+def feed_item(post) -> dict:
+    # The page is rendered after the session has closed, so it only gets plain values
+    return {
+        'id': post.id,
+        'username': post.user.username,
+        'created_at': post.created_at,
+        'content': post.content,
+        'truncated_content': post.truncated_content()
+    }
 
 
 @router.get('/', description="Display the root page with paginated posts.")
+@cached(tags=("feed",))
+@conditional
 async def root(request: Request,
-               db: AsyncSession = Depends(get_session),
+               db: AsyncSession = Depends(get_read_session),
                user: TokenData | None = Depends(check_user),
-               page: int = Query(1, description="Page number"),
-               page_size: int = Query(21, description="Number of posts per page")):
+               page: int = Query(1, ge=1, description="Page number"),
+               last: bool = Query(False, description="Show the last page"),
+               page_size: int = Query(21, ge=1, le=100, description="Number of posts per page"),
+               after: str | None = Query(None, description="Cursor of the last post on the previous page"),
+               before: str | None = Query(None, description="Cursor of the first post on the next page")):
     """
     Display the root page with paginated posts.
 
@@ -28,22 +46,36 @@ async def root(request: Request,
         db (AsyncSession): The database session.
         user (TokenData): The authenticated user data.
         page (int): The page number for pagination.
+        last (bool): Show the last page, used by the "last" link instead of its page number.
         page_size (int): The number of posts per page.
+        after (str): Keyset cursor to continue the feed after, used by the "next" link.
+        before (str): Keyset cursor to continue the feed before, used by the "previous" link.
 
     Returns:
-        TemplateResponse: The rendered HTML template with the root page content.
+        StreamingTemplateResponse: The root page, streamed as it is rendered.
     """
-    skip = (page - 1) * page_size
     limit = page_size
 
-    posts = await get_paginated_posts(db, skip=skip, limit=limit)
     total_posts = await get_total_posts_count(db)
-
     total_pages = (total_posts + page_size - 1) // page_size
+    if last:
+        page = max(total_pages, 1)
+
+    cursor = decode_cursor(after or before)
+    if cursor:
+        direction = "after" if after else "before"
+        posts = await get_posts_by_cursor(db, cursor, direction=direction, limit=limit)
+    elif page > (total_pages + 1) // 2:
+        # Pages in the older half are counted from the oldest post, so no OFFSET scans more
+        # than half of the feed and the last page is a plain index seek
+        end = max(total_posts - (page - 1) * page_size, 0)
+        skip = max(end - page_size, 0)
+        posts = await get_paginated_posts(db, skip=skip, limit=end - skip, from_end=True) if end else []
+    else:
+        skip = (page - 1) * page_size
+        posts = await get_paginated_posts(db, skip=skip, limit=limit)
 
-    unsplash_photo = await load_unsplash_photo('universe galaxy cosmos')
-    if unsplash_photo is None:
-        unsplash_photo = '/static/img/default_unsplash.jpg'
+    unsplash_photo = unsplash_pool.get_photo()
 
     top_message = request.session.get('top_message')
     if top_message is None:
@@ -56,13 +88,15 @@ async def root(request: Request,
     else:
         request.session.pop('top_message', None)
 
-    return templates.TemplateResponse("root.html", {
+    return StreamingTemplateResponse("root.html", {
         "request": request,
         "user": user,
         "top_message": top_message,
-        "posts": posts,
+        "posts": [feed_item(post) for post in posts],
         "unsplash_photo": unsplash_photo,
         "page": page,
         "total_pages": total_pages,
-        "page_size": page_size
+        "page_size": page_size,
+        "prev_cursor": encode_cursor(posts[0].created_at, posts[0].id) if posts else None,
+        "next_cursor": encode_cursor(posts[-1].created_at, posts[-1].id) if posts else None
     })
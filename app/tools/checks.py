@@ -0,0 +1,16 @@
+from loguru import logger
+
+
+class Checks:
+    """Counts and logs the outcomes of the expectations in a runnable check."""
+
+    def __init__(self):
+        self.failures = 0
+
+    def expect(self, description: str, passed: bool, detail: str = ""):
+        suffix = f": {detail}" if detail else ""
+        if passed:
+            logger.info(f"ok   {description}{suffix}")
+        else:
+            self.failures += 1
+            logger.error(f"FAIL {description}{suffix}")
@@ -0,0 +1,63 @@
+"""
+Build step writing `.br` and `.gz` siblings of the compressible static assets.
+
+PrecompressedStaticFiles serves them to clients that accept the encoding, so assets are
+compressed once, at maximum level, instead of on every request. A sibling is only kept
+when it is smaller than the original and is rebuilt when the original changes.
+
+Usage:
+    python -m app.tools.compress_static [directory]
+"""
+import gzip
+import os
+import sys
+
+from loguru import logger
+
+from app.config import BASE_DIR
+from app.tools.compression import brotli
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map')
+
+
+def compress_file(path: str) -> list[str]:
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    encoders = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encoders.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+
+    written = []
+    source_mtime = os.path.getmtime(path)
+    for suffix, encode in encoders:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+            continue
+        encoded = encode(data)
+        if len(encoded) >= len(data):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        with open(target, 'wb') as f:
+            f.write(encoded)
+        written.append(target)
+    return written
+
+
+def compress_directory(directory: str) -> int:
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                for target in compress_file(os.path.join(root, name)):
+                    logger.info(f"Wrote {os.path.relpath(target, directory)}")
+                    count += 1
+    return count
+
+
+if __name__ == "__main__":
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BASE_DIR, 'static')
+    if brotli is None:
+        logger.warning("brotli is not installed, only .gz files are written")
+    logger.info(f"{compress_directory(static_dir)} precompressed file(s) written")
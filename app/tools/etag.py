@@ -0,0 +1,65 @@
+import functools
+import hashlib
+
+from fastapi import Request, Response, status
+
+from app.config import PUBLIC_PAGE_SHARED_MAX_AGE
+from app.database.crud import get_posts_version
+from app.tools.functions import etag_matches
+
+
+def page_etag(request: Request, principal: dict | None, version: int) -> str:
+    """
+    Weak ETag of a page: the path, the query string, who is asking and the posts version.
+
+    The ETag is weak because the random background photo makes two renders of the same
+    data differ byte for byte.
+    """
+    query = sorted(request.query_params.multi_items())
+    identity = f"{principal['user_id']}:{principal['role']}" if principal else "anonymous"
+    digest = hashlib.sha1(f"{request.url.path}|{query}|{identity}|{version}".encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def page_cache_headers(principal: dict | None, etag: str) -> dict:
+    if principal is None:
+        # Anonymous pages may be stored by a reverse proxy, browsers always revalidate
+        cache_control = f"public, max-age=0, s-maxage={PUBLIC_PAGE_SHARED_MAX_AGE}, must-revalidate"
+    else:
+        cache_control = "private, no-cache"
+    return {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Cookie"
+    }
+
+
+def conditional(endpoint):
+    """
+    Answer If-None-Match with 304 Not Modified before the endpoint queries or renders anything.
+
+    The ETag is derived from the posts version counter, a single primary key lookup that
+    every post write bumps. The decorated endpoint must take `request` and `db` arguments.
+    Pages carrying a flash message are sent with `no-store` instead of validators.
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        request: Request = kwargs['request']
+        if request.method != 'GET' or 'top_message' in request.session:
+            response = await endpoint(*args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response.headers["Cache-Control"] = "private, no-store"
+            return response
+
+        principal = getattr(request.state, 'principal', None)
+        version = await get_posts_version(kwargs['db'])
+        headers = page_cache_headers(principal, page_etag(request, principal, version))
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response = await endpoint(*args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response.headers.update(headers)
+        return response
+
+    return wrapper
@@ -1,97 +1,109 @@
 import base64
+import binascii
+import hashlib
 import os
-import random
 import tempfile
-from uuid import uuid4
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 
 import aiofiles
-import httpx
-from PIL import Image
-from fastapi import (UploadFile,
+from fastapi import (HTTPException,
+                     UploadFile,
                      Request,
                      status
                      )
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, FileResponse, Response
 from loguru import logger
 
-from app.config import UNSPLASH_ACCESS_KEY
+from app.config import MAX_AVATAR_UPLOAD_BYTES
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
-async def save_file_with_uuid(upload_file: UploadFile, destination_dir: str):
-    if upload_file is None:
-        logger.debug("No file provided.")
-        return None
+avatar_too_large_exception = HTTPException(
+    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    detail="Image file is too large!",
+)
 
-    _, ext = os.path.splitext(upload_file.filename)
-    uuid_filename = f"{uuid4()}{ext}"
-    destination = os.path.join(destination_dir, uuid_filename)
 
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_filename = temp_file.name
-        async with aiofiles.open(temp_filename, 'wb') as out_file:
-            while content := await upload_file.read(1024):  # Read file in chunks
-                await out_file.write(content)
+async def save_upload_to_temp(upload_file: UploadFile) -> tuple[str, str]:
+    """
+    Copy an uploaded avatar to a named temporary file, hashing it on the way.
 
-    try:
-        img = Image.open(temp_filename)
-        width, height = img.size
+    Request bodies too large for an avatar are already turned away by UploadLimitMiddleware
+    before the form is parsed; this still rejects a file just over MAX_AVATAR_UPLOAD_BYTES
+    that fits in the allowance left for the other form fields. The caller is responsible for
+    removing the temporary file.
 
-        if max(width, height) > 1024:
-            aspect_ratio = min(1024 / width, 1024 / height)
-            new_size = (int(width * aspect_ratio), int(height * aspect_ratio))
-            img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-        img.save(destination)
-    finally:
-        os.remove(temp_filename)
-
-    return destination
+    Returns:
+        tuple: The temporary file name and the SHA-256 hex digest of the content.
+    """
+    if upload_file.size is not None and upload_file.size > MAX_AVATAR_UPLOAD_BYTES:
+        raise avatar_too_large_exception
 
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_filename = temp_file.name
 
-async def read_and_encode_photo(photo_path):
     try:
-        async with aiofiles.open(photo_path, 'rb') as photo_file:
-            photo_data = await photo_file.read()
-            photo_base64 = base64.b64encode(photo_data).decode('utf-8')
-            return photo_base64
-    except FileNotFoundError:
-        logger.debug(f"File not found: {photo_path}")
-        return None
-    except Exception as e:
-        logger.debug(f"Error encoding photo {photo_path}: {e}")
-        return None
-
-
-async def load_unsplash_photo(query: str = "cosmos") -> str | None:
-    url = "https://api.unsplash.com/search/photos"
+        received = 0
+        content_hash = hashlib.sha256()
+        async with aiofiles.open(temp_filename, 'wb') as out_file:
+            while content := await upload_file.read(UPLOAD_CHUNK_SIZE):  # Read file in chunks
+                received += len(content)
+                if received > MAX_AVATAR_UPLOAD_BYTES:
+                    raise avatar_too_large_exception
+                content_hash.update(content)
+                await out_file.write(content)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+
+    return temp_filename, content_hash.hexdigest()
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Weak comparison of etag against the If-None-Match header, as RFC 9110 requires for GET.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return opaque in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+def file_response_with_validators(request: Request, path: str, cache_control: str, vary: str | None = None):
+    """
+    Serve a file with strong ETag, Last-Modified and Cache-Control headers.
+
+    Conditional requests (If-None-Match, then If-Modified-Since) are answered with
+    304 Not Modified without opening the file.
+    """
+    stat = os.stat(path)
+    etag = '"' + hashlib.sha1(f"{path}-{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest() + '"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
     headers = {
-        "Accept-Version": "v1",
-        "Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"
-    }
-    params = {
-        "query": query,
-        "orientation": "landscape",
-        "per_page": 50
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control
     }
+    if vary:
+        headers["Vary"] = vary
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            data = response.json()
-            if data.get('results'):
-                random_index = random.randint(0, len(data['results']) - 1)
-                image_url = data['results'][random_index]['urls']['regular']
-            else:
-                image_url = None
-        except httpx.HTTPStatusError as errh:
-            logger.debug("HTTP error occurred:", errh)
-            image_url = None
-        except httpx.RequestError as err:
-            logger.debug("An error occurred:", err)
-            image_url = None
-
-    return image_url
+    if request.headers.get("if-none-match") is not None:
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                if int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            except (TypeError, ValueError):
+                pass
+
+    return FileResponse(path, headers=headers)
 
 
 async def redirect_with_message(request: Request,
@@ -111,3 +123,54 @@ async def redirect_with_message(request: Request,
     response = RedirectResponse(url=endpoint,
                                 status_code=status.HTTP_302_FOUND)
     return response
+
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{post_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, post_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        logger.debug(f"Invalid pagination cursor: {cursor}")
+        return None
+
+
+def encode_rank_cursor(rank: float, post_id: int) -> str:
+    raw = f"{rank!r}|{post_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_rank_cursor(cursor: str | None) -> tuple[float, int] | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        rank, post_id = raw.rsplit('|', 1)
+        return float(rank), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        logger.debug(f"Invalid search cursor: {cursor}")
+        return None
+
+
+def encode_int_cursor(*values: int) -> str:
+    raw = '|'.join(str(value) for value in values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_int_cursor(cursor: str | None, size: int) -> tuple[int, ...] | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        values = tuple(int(value) for value in raw.split('|'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        logger.debug(f"Invalid pagination cursor: {cursor}")
+        return None
+    return values if len(values) == size else None
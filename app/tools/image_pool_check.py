@@ -0,0 +1,95 @@
+"""
+Check that avatar processing in app/tools/images.py survives the death of its workers.
+
+Processes generated images through process_avatar and kills the image worker processes
+with SIGKILL, the way the kernel's OOM killer would:
+
+- a worker killed while idle breaks the pool, and the next upload is still processed, by
+  a new pool;
+- a worker killed while decoding an upload turns that upload into the usual "File must
+  be an image!" error, and the upload after it is processed again.
+
+Needs nothing but Pillow; the generated files are written to a temporary directory.
+
+Usage:
+    python -m app.tools.image_pool_check
+"""
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+
+from PIL import Image
+from fastapi import HTTPException
+from loguru import logger
+
+from app.tools import images
+from app.tools.checks import Checks
+from app.tools.images import process_avatar
+
+
+def write_image(directory: str, name: str, size: int) -> str:
+    # Noise does not compress, so a large PNG takes long enough to decode to be killed midway
+    path = os.path.join(directory, name)
+    Image.frombytes("RGB", (size, size), os.urandom(size * size * 3)).save(path, format="PNG")
+    return path
+
+
+def kill_workers():
+    for process in list(images._image_executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+
+async def processed(source_path: str, destination_dir: str, stem: str) -> tuple[bool, str]:
+    try:
+        manifest = await process_avatar(source_path, destination_dir, stem)
+    except HTTPException as e:
+        return False, f"status {e.status_code}: {e.detail}"
+    return bool(manifest), "processed"
+
+
+async def run_checks(directory: str) -> int:
+    checks = Checks()
+    small = write_image(directory, "small.png", 300)
+    large = write_image(directory, "large.png", 4000)
+
+    passed, detail = await processed(small, directory, "first")
+    checks.expect("an upload is processed", passed, detail)
+
+    broken = images._image_executor
+    kill_workers()
+    await asyncio.sleep(0.5)  # until the pool has noticed
+    passed, detail = await processed(small, directory, "after_idle_kill")
+    checks.expect("the upload after a worker died while idle is processed", passed, detail)
+    checks.expect("the broken pool was replaced", images._image_executor is not broken)
+
+    job = asyncio.create_task(processed(large, directory, "killed"))
+    await asyncio.sleep(0.2)
+    kill_workers()
+    passed, detail = await job
+    checks.expect("an upload whose worker died is rejected as an invalid image",
+                  not passed and detail == "status 400: File must be an image!", detail)
+
+    passed, detail = await processed(small, directory, "after_busy_kill")
+    checks.expect("the upload after a worker died while busy is processed", passed, detail)
+    return checks.failures
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            failures = await run_checks(directory)
+        finally:
+            if images._image_executor is not None:
+                images._image_executor.shutdown()
+
+    if failures:
+        logger.error(f"{failures} image pool failure(s)")
+        return 1
+    logger.info("Avatar processing recovers from dead workers")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
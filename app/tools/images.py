@@ -0,0 +1,149 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+from fastapi import HTTPException, status
+from loguru import logger
+
+from app.config import IMAGE_WORKERS, MAX_AVATAR_PIXELS
+
+AVATAR_SIZES = (64, 256, 1024)
+
+# MIME type -> (Pillow format, file extension, save options)
+AVATAR_FORMATS = {
+    'image/webp': ('WEBP', '.webp', {'quality': 80, 'method': 4}),
+    'image/jpeg': ('JPEG', '.jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_image_executor: ProcessPoolExecutor | None = None
+_image_slots = asyncio.Semaphore(IMAGE_WORKERS)
+
+
+def generate_avatar_variants(source_path: str, destination_dir: str, stem: str,
+                             max_pixels: int = MAX_AVATAR_PIXELS) -> dict:
+    """
+    Write every avatar size in every avatar format next to each other.
+
+    Images larger than max_pixels are rejected from the header, before any pixel data is
+    decoded. JPEGs are decoded in draft mode, which lets libjpeg downscale by up to 8x
+    while decoding instead of materialising the full-resolution bitmap.
+
+    Returns:
+        dict: The manifest, mapping each size (as a string) to {MIME type: file path}.
+    """
+    manifest = {}
+    with Image.open(source_path) as img:
+        width, height = img.size
+        if width * height > max_pixels:
+            raise Image.DecompressionBombError(f"Image has {width * height} pixels, the limit is {max_pixels}")
+
+        largest = max(AVATAR_SIZES)
+        if img.format == 'JPEG':
+            img.draft('RGB', (largest, largest))
+
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+
+        for size in sorted(AVATAR_SIZES, reverse=True):
+            # Each variant is derived from the previous, larger one to keep resampling cheap
+            img = img.copy()
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            manifest[str(size)] = {}
+            for mime_type, (image_format, ext, options) in AVATAR_FORMATS.items():
+                variant = img.convert('RGB') if image_format == 'JPEG' else img
+                path = os.path.join(destination_dir, f"{stem}_{size}{ext}")
+                variant.save(path, image_format, **options)
+                manifest[str(size)][mime_type] = path
+
+    return manifest
+
+
+def _get_image_executor() -> ProcessPoolExecutor:
+    # Created lazily so that forked workers never inherit a pool from the parent process
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _image_executor
+
+
+def _discard_image_executor(executor: ProcessPoolExecutor):
+    # A pool whose worker died refuses every later job; the next call starts a new one
+    global _image_executor
+    if _image_executor is executor:
+        _image_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit_avatar_job(*args) -> tuple[ProcessPoolExecutor, asyncio.Future]:
+    executor = _get_image_executor()
+    try:
+        future = executor.submit(generate_avatar_variants, *args)
+    except BrokenProcessPool:
+        # Broken by an earlier job, so this image has not been tried yet: use a new pool
+        _discard_image_executor(executor)
+        executor = _get_image_executor()
+        future = executor.submit(generate_avatar_variants, *args)
+    return executor, asyncio.wrap_future(future)
+
+
+async def process_avatar(source_path: str, destination_dir: str, stem: str) -> dict:
+    """
+    Run generate_avatar_variants in the image process pool, at most IMAGE_WORKERS at a time.
+
+    Undecodable or oversized images are reported as HTTPException. So is an image whose
+    worker process died while decoding it, for example killed for running out of memory;
+    the broken pool is then replaced, so later uploads are processed again.
+    """
+    async with _image_slots:
+        executor = None
+        try:
+            executor, job = _submit_avatar_job(source_path, destination_dir, stem)
+            return await job
+        except BrokenProcessPool as e:
+            logger.warning(f"Image worker died while processing avatar {source_path}: {e!r}")
+            if executor is not None:
+                _discard_image_executor(executor)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="File must be an image!")
+        except Image.DecompressionBombError as e:
+            logger.debug(f"Rejected avatar {source_path}: {e}")
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail="Image resolution is too large!")
+        except (Image.UnidentifiedImageError, OSError, ValueError) as e:
+            logger.debug(f"Could not process avatar {source_path}: {e}")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="File must be an image!")
+
+
+def largest_avatar_path(manifest: dict) -> str:
+    largest = max(manifest, key=int)
+    return manifest[largest]['image/jpeg']
+
+
+def choose_avatar_variant(manifest: dict, size: int | None, accept: str) -> str:
+    """
+    Pick the smallest variant at least `size` pixels wide, in WebP when the client accepts it.
+    """
+    sizes = sorted(int(key) for key in manifest)
+    chosen = sizes[-1]
+    if size:
+        chosen = next((candidate for candidate in sizes if candidate >= size), sizes[-1])
+    mime_type = 'image/webp' if 'image/webp' in accept else 'image/jpeg'
+    return manifest[str(chosen)].get(mime_type) or manifest[str(chosen)]['image/jpeg']
+
+
+def remove_avatar_files(photo_path: str | None, manifest: dict | None):
+    paths = {photo_path} if photo_path else set()
+    for variants in (manifest or {}).values():
+        paths.update(variants.values())
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug(f"Could not remove avatar file {path}: {e}")
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import asyncpg
+from loguru import logger
+
+from app.config import SYNC_DATABASE_URL, CACHE_INVALIDATION_CHANNEL
+
+# NOTIFY payloads are limited to 8000 bytes; larger invalidations are split
+MAX_PAYLOAD_BYTES = 7000
+RECONNECT_DELAY = 5
+KEEPALIVE_INTERVAL = 30
+
+
+class InvalidationBus:
+    """
+    Relays cache invalidations between worker processes with Postgres LISTEN/NOTIFY.
+
+    Caches subscribe with a handler for the keys they drop and a function that clears them.
+    Local invalidations are published in the background and applied by every other process
+    listening on the channel, on any host. While the connection is down the caches fall back
+    to their TTLs, and they are cleared on every (re)connect since notifications may have been
+    missed in between.
+    """
+
+    def __init__(self, channel: str = CACHE_INVALIDATION_CHANNEL, dsn: str = SYNC_DATABASE_URL):
+        self.channel = channel
+        self.dsn = dsn
+        self.received = 0
+        self.published = 0
+        self._subscribers: dict[str, tuple] = {}
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._server_pid: int | None = None
+
+    def subscribe(self, kind: str, invalidate, clear):
+        self._subscribers[kind] = (invalidate, clear)
+
+    def publish(self, kind: str, keys: list):
+        # Before start() (scripts, maintenance commands) there is nobody to tell
+        if self._queue is not None and keys:
+            self._queue.put_nowait((kind, keys))
+
+    async def start(self):
+        if not self.channel:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._queue = None
+
+    def stats(self) -> dict:
+        return {
+            "channel": self.channel,
+            "connected": self._server_pid is not None,
+            "published": self.published,
+            "received": self.received
+        }
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str):
+        if pid == self._server_pid:
+            return  # our own notification, already applied locally
+        message = json.loads(payload)
+        subscriber = self._subscribers.get(message['kind'])
+        if subscriber:
+            subscriber[0](message['keys'])
+            self.received += 1
+
+    def _payloads(self, kind: str, keys: list):
+        batch = []
+        size = 0
+        for key in keys:
+            encoded = len(json.dumps(key))
+            if batch and size + encoded > MAX_PAYLOAD_BYTES:
+                yield json.dumps({"kind": kind, "keys": batch})
+                batch = []
+                size = 0
+            batch.append(key)
+            size += encoded + 1
+        yield json.dumps({"kind": kind, "keys": batch})
+
+    async def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._on_notify)
+                self._server_pid = connection.get_server_pid()
+                for _, clear in self._subscribers.values():
+                    clear()
+                while True:
+                    try:
+                        kind, keys = await asyncio.wait_for(self._queue.get(), KEEPALIVE_INTERVAL)
+                    except asyncio.TimeoutError:
+                        # An idle listener would not notice a dropped connection otherwise
+                        await connection.execute("SELECT 1")
+                        continue
+                    for payload in self._payloads(kind, keys):
+                        await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                        self.published += 1
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning(f"Cache invalidation channel unavailable, retrying in {RECONNECT_DELAY}s: {e!r}")
+            finally:
+                self._server_pid = None
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,105 @@
+"""
+Closed-loop HTTP load generator for measuring throughput at different worker counts.
+
+Every connection sends its next request as soon as the previous answer arrived, cycling
+through the given paths, for a fixed duration after a warm-up. The load is spread over
+several client processes so the generator is not the bottleneck; keep an eye on its CPU
+usage anyway, and run it from another machine when the server has few cores to spare.
+
+Usage:
+    python -m app.tools.load_benchmark --url http://localhost:8000 --path / --path /posts/view/1 \
+        --connections 64 --duration 30 [--processes 4] [--label "4 workers"]
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from multiprocessing import Pool
+
+import httpx
+
+
+async def run_connections(base_url: str, paths: list[str], connections: int, warmup: float, duration: float):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        measure_from = start + warmup
+        stop_at = measure_from + duration
+
+        async def connection(offset: int):
+            nonlocal errors
+            for path in itertools.islice(itertools.cycle(paths), offset, None):
+                sent = time.perf_counter()
+                if sent >= stop_at:
+                    return
+                try:
+                    response = await client.get(path)
+                    failed = response.status_code >= 500
+                except httpx.HTTPError:
+                    failed = True
+                if sent >= measure_from:
+                    if failed:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - sent)
+
+        await asyncio.gather(*(connection(i) for i in range(connections)))
+    return latencies, errors
+
+
+def run_process(args: tuple):
+    return asyncio.run(run_connections(*args))
+
+
+def percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(label: str, latencies: list[float], summary: str):
+    """Print one line with the latency percentiles of a phase, after a summary such as its error count."""
+    if not latencies:
+        print(f"{label}: no successful requests, {summary}")
+        return
+    ordered = sorted(latencies)
+    print(f"{label}: {len(ordered)} requests, {summary}, latency ms"
+          f"  p50 {percentile(ordered, 0.50) * 1000:.1f}"
+          f"  p95 {percentile(ordered, 0.95) * 1000:.1f}"
+          f"  p99 {percentile(ordered, 0.99) * 1000:.1f}"
+          f"  max {ordered[-1] * 1000:.1f}"
+          f"  mean {statistics.fmean(ordered) * 1000:.1f}")
+
+
+def main(args):
+    paths = args.path or ["/"]
+    per_process = max(1, args.connections // args.processes)
+    jobs = [(args.url, paths, per_process, args.warmup, args.duration)] * args.processes
+    with Pool(args.processes) as pool:
+        results = pool.map(run_process, jobs)
+
+    latencies = sorted(latency for process_latencies, _ in results for latency in process_latencies)
+    errors = sum(process_errors for _, process_errors in results)
+    if not latencies:
+        print(f"{args.label}: no successful requests, {errors} errors")
+        return
+
+    print(f"{args.label}: {len(latencies) / args.duration:.1f} req/s over {args.duration:.0f} s, "
+          f"{per_process * args.processes} connections, {errors} errors")
+    print(f"  latency ms  p50 {percentile(latencies, 0.50) * 1000:.1f}"
+          f"  p95 {percentile(latencies, 0.95) * 1000:.1f}"
+          f"  p99 {percentile(latencies, 0.99) * 1000:.1f}"
+          f"  mean {statistics.fmean(latencies) * 1000:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure request throughput and latency of a running server.")
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of the server")
+    parser.add_argument("--path", action="append", help="path to request, repeat for several (default /)")
+    parser.add_argument("--connections", type=int, default=64, help="concurrent connections in total")
+    parser.add_argument("--processes", type=int, default=4, help="client processes sharing the connections")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to measure")
+    parser.add_argument("--label", default="result", help="name printed with the results")
+    main(parser.parse_args())
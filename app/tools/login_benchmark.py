@@ -0,0 +1,91 @@
+"""
+Measure how a login storm affects the latency of other pages.
+
+Probes GET / on a running server at a fixed pace, first on its own and then while
+--login-connections connections send POST /login back to back. Every login runs a bcrypt
+verification, so the difference between the two phases shows how much password hashing
+still delays the event loop; logins rejected with 503 by the password pool are counted
+separately. The account must exist, since a login for an unknown username skips bcrypt.
+
+Usage:
+    python -m app.tools.login_benchmark --url http://localhost:8000 --username alice --password secret \
+        [--login-connections 32] [--probe-interval 0.05] [--duration 20]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.tools.load_benchmark import report
+
+
+async def probe(client: httpx.AsyncClient, path: str, interval: float, duration: float) -> tuple[list[float], int]:
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+    while time.perf_counter() < stop_at:
+        sent = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - sent)
+        except httpx.HTTPError:
+            errors += 1
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - sent)))
+    return latencies, errors
+
+
+async def hammer_login(client: httpx.AsyncClient, username: str, password: str, stop: asyncio.Event, outcomes: dict):
+    while not stop.is_set():
+        try:
+            # A fresh cookie jar per attempt, so every request really authenticates
+            client.cookies.clear()
+            response = await client.post("/login", data={"username": username, "password": password})
+            outcome = "busy" if response.status_code == 503 else "error" if response.status_code >= 500 else "ok"
+        except httpx.HTTPError:
+            outcome = "error"
+        outcomes[outcome] += 1
+
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as probe_client:
+        await probe_client.get(args.path)  # warm up the connection and the page
+        latencies, errors = await probe(probe_client, args.path, args.probe_interval, args.duration)
+        report(f"GET {args.path} alone", latencies, f"{errors} errors")
+
+        stop = asyncio.Event()
+        outcomes = {"ok": 0, "busy": 0, "error": 0}
+        login_clients = [httpx.AsyncClient(base_url=args.url, timeout=30) for _ in range(args.login_connections)]
+        try:
+            logins = [asyncio.create_task(hammer_login(client, args.username, args.password, stop, outcomes))
+                      for client in login_clients]
+            await asyncio.sleep(args.warmup)
+            started = outcomes.copy()
+            latencies, errors = await probe(probe_client, args.path, args.probe_interval, args.duration)
+            finished = outcomes.copy()
+            stop.set()
+            await asyncio.gather(*logins)
+        finally:
+            for client in login_clients:
+                await client.aclose()
+
+        report(f"GET {args.path} during the login storm", latencies, f"{errors} errors")
+        print(f"POST /login: {(finished['ok'] - started['ok']) / args.duration:.1f} logins/s, "
+              f"{finished['busy'] - started['busy']} rejected as busy (503), "
+              f"{finished['error'] - started['error']} errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure page latency while /login is under load.")
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of the server")
+    parser.add_argument("--username", required=True, help="existing account used for the logins")
+    parser.add_argument("--password", required=True, help="its password")
+    parser.add_argument("--path", default="/", help="page whose latency is probed")
+    parser.add_argument("--login-connections", type=int, default=32, help="connections sending logins")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probes")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of login load before probing")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to probe in each phase")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,436 @@
+import asyncio
+import bisect
+import contextlib
+import glob
+import json
+import os
+import time
+from contextvars import ContextVar
+
+from loguru import logger
+from sqlalchemy import event
+from starlette.routing import Mount
+
+from app.config import METRICS_ENABLED, QUERY_BUDGET_WARNINGS, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL
+from app.database.pool import CHECKOUT_BUCKETS
+from app.database.postgre_db import engine, replica_engines, named_engines
+from app.tools.query_budget import check_query_budget
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# Requests that matched no route share one label, so scanners cannot blow up the series count
+UNMATCHED_ROUTE = 'unmatched'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, **extra) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra.items()]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def histogram_lines(name: str, buckets: tuple, counts: list, total: float,
+                    labelnames: tuple = (), labels: tuple = ()) -> list[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(buckets + (float('inf'),), counts):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else _number(bound)
+        lines.append(f'{name}_bucket{_labels(labelnames, labels, le=le)} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labelnames, labels)} {_number(total)}')
+    lines.append(f'{name}_count{_labels(labelnames, labels)} {cumulative}')
+    return lines
+
+
+class Histogram:
+    """
+    Histogram with one series per combination of label values.
+
+    Observations are plain increments on the event loop thread, so no locking is needed;
+    every worker process keeps its own series, and snapshots of them can be merged.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def snapshot(self) -> list:
+        return [[list(labels), counts, total] for labels, (counts, total) in self._series.items()]
+
+    def merge(self, snapshot: list):
+        for labels, counts, total in snapshot:
+            series = self._series.setdefault(tuple(labels), [[0] * (len(self.buckets) + 1), 0.0])
+            series[0] = [mine + theirs for mine, theirs in zip(series[0], counts)]
+            series[1] += total
+
+    def empty(self):
+        return Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+
+    def expose(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self._series.items()):
+            lines += histogram_lines(self.name, self.buckets, counts, total, self.labelnames, labels)
+        return lines
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def snapshot(self) -> list:
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merge(self, snapshot: list):
+        for labels, value in snapshot:
+            self.inc(*labels, amount=value)
+
+    def empty(self):
+        return type(self)(self.name, self.documentation, self.labelnames)
+
+    def expose(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Counter(Gauge):
+    kind = 'counter'
+
+
+request_duration = Histogram('http_request_duration_seconds',
+                             'Time from receiving the request to sending the last body byte.',
+                             ('method', 'route', 'status'))
+requests_in_flight = Gauge('http_requests_in_flight', 'Requests being handled by this worker.', ('method',))
+request_db_duration = Histogram('http_request_db_seconds',
+                                'Time spent executing SQL statements per request.',
+                                ('route',))
+request_db_queries = Histogram('http_request_db_queries',
+                               'SQL statements executed per request.',
+                               ('route',), buckets=QUERY_COUNT_BUCKETS)
+template_duration = Histogram('template_render_seconds', 'Time spent rendering a template.', ('template',))
+unsplash_duration = Histogram('unsplash_request_duration_seconds',
+                              'Latency of Unsplash API calls.',
+                              ('outcome',))
+
+METRICS = (request_duration, requests_in_flight, request_db_duration, request_db_queries,
+           template_duration, unsplash_duration)
+
+
+class RequestStats:
+    __slots__ = ('db_seconds', 'db_queries')
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+
+
+# Set by MetricsMiddleware for the duration of a request. SQLAlchemy runs the cursor events
+# in a greenlet that shares the context of the awaiting task, so the listeners below see it.
+request_stats: ContextVar[RequestStats | None] = ContextVar('request_stats', default=None)
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.db_seconds += elapsed
+        stats.db_queries += 1
+
+
+def _discard_query_timer(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+for _engine in (engine, *replica_engines):
+    event.listen(_engine.sync_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(_engine.sync_engine, "after_cursor_execute", _stop_query_timer)
+    event.listen(_engine.sync_engine, "handle_error", _discard_query_timer)
+
+
+def route_template(app, scope: dict, cache: dict) -> str:
+    """
+    Return the path template of the route that handled the request, e.g. /posts/view/{post_id}.
+
+    The router stores the matched endpoint in the scope; endpoints are mapped back to their
+    templates once, from the application's routes.
+    """
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    if not cache:
+        for route in app.routes:
+            if isinstance(route, Mount):
+                cache[route.app] = route.path
+            elif hasattr(route, 'endpoint'):
+                cache[route.endpoint] = route.path
+    return cache.get(endpoint, UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status, SQL time and in-flight count of every HTTP request, and check
+    the number of SQL statements against the route's query budget when that is enabled.
+
+    Added last, so it wraps every other middleware and times the response until its last
+    body byte, streamed pages included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: dict = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        method = scope['method']
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        requests_in_flight.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec(method)
+            request_stats.reset(token)
+            route = route_template(scope['app'], scope, self._routes)
+            if METRICS_ENABLED:
+                request_duration.observe(elapsed, method, route, str(status))
+                request_db_duration.observe(stats.db_seconds, route)
+                request_db_queries.observe(stats.db_queries, route)
+            if QUERY_BUDGET_WARNINGS:
+                check_query_budget(method, route, stats.db_queries)
+
+
+def _pool_metrics() -> list:
+    labelnames = ('engine',)
+    size = Gauge('db_pool_size', 'Configured size of the connection pool.', labelnames)
+    checked_out = Gauge('db_pool_checked_out', 'Connections currently checked out.', labelnames)
+    overflow = Gauge('db_pool_overflow', 'Overflow connections currently open.', labelnames)
+    timeouts = Counter('db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection.', labelnames)
+    checkouts = Histogram('db_pool_checkout_seconds', 'Time spent waiting for a pooled connection.',
+                          labelnames, buckets=CHECKOUT_BUCKETS)
+    connects = Histogram('db_pool_connect_seconds', 'Time spent opening a new database connection.',
+                         labelnames, buckets=CHECKOUT_BUCKETS)
+    for name, db_engine in named_engines:
+        pool = db_engine.pool
+        size.set(pool.size(), name)
+        checked_out.set(pool.checkedout(), name)
+        overflow.set(pool.overflow(), name)
+        timeouts.set(pool.metrics.timeouts, name)
+        checkouts.merge([[[name], pool.metrics.bucket_counts, pool.metrics.checkout_seconds]])
+        connects.merge([[[name], pool.metrics.connect_bucket_counts, pool.metrics.connect_seconds]])
+    return [size, checked_out, overflow, timeouts, checkouts, connects]
+
+
+def collect() -> list:
+    """Every metric of this worker."""
+    return list(METRICS) + _pool_metrics()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsSnapshots:
+    """
+    Shares the metrics of every worker process through snapshot files in one directory.
+
+    Each worker rewrites its own file every few seconds and on shutdown. /metrics, on
+    whichever worker answers it, merges the other workers' files with its own live series:
+    histograms and counters of workers that have exited are kept so totals never go
+    backwards, gauges only count live workers. So that files do not pile up as workers are
+    replaced, the snapshots of exited workers are folded into a single retired file and
+    removed, under a lock that readers share. Nothing is written while metrics are off.
+    """
+
+    RETIRED_FILE = "retired.json"
+    LOCK_FILE = "snapshots.lock"
+
+    def __init__(self, directory: str = METRICS_DIR, interval: float = METRICS_SNAPSHOT_INTERVAL,
+                 enabled: bool = METRICS_ENABLED):
+        self.directory = directory
+        self.interval = interval
+        self.enabled = enabled
+        self._task: asyncio.Task | None = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"worker-{os.getpid()}.json")
+
+    async def start(self):
+        if not self.enabled or not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._task = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.write()
+
+    def write(self):
+        snapshot = {"pid": os.getpid(), "metrics": {metric.name: metric.snapshot() for metric in collect()}}
+        self._replace(self.path, snapshot)
+
+    def read_others(self) -> list[dict]:
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+            snapshot = self._read(path)
+            if snapshot is not None and snapshot['pid'] != os.getpid():
+                snapshot['path'] = path
+                snapshot['alive'] = _pid_alive(snapshot['pid'])
+                snapshots.append(snapshot)
+        return snapshots
+
+    def retire_exited(self):
+        """Fold the counters and histograms of exited workers into the retired file and remove theirs."""
+        with self._locked(exclusive=True):
+            exited = [snapshot for snapshot in self.read_others() if not snapshot['alive']]
+            if not exited:
+                return
+            retired_path = os.path.join(self.directory, self.RETIRED_FILE)
+            retired = self._read(retired_path) or {"metrics": {}}
+            for metric in collect():
+                if metric.kind == 'gauge':
+                    continue
+                combined = metric.empty()
+                combined.merge(retired['metrics'].get(metric.name, []))
+                for snapshot in exited:
+                    combined.merge(snapshot['metrics'].get(metric.name, []))
+                retired['metrics'][metric.name] = combined.snapshot()
+            self._replace(retired_path, retired)
+            for snapshot in exited:
+                os.remove(snapshot['path'])
+
+    def merged(self) -> list:
+        with self._locked(exclusive=False):
+            others = self.read_others()
+            retired = self._read(os.path.join(self.directory, self.RETIRED_FILE))
+        if retired is not None:
+            others.append({**retired, "alive": False})
+        metrics = []
+        for metric in collect():
+            combined = metric.empty()
+            combined.merge(metric.snapshot())
+            for snapshot in others:
+                if metric.kind == 'gauge' and not snapshot['alive']:
+                    continue
+                combined.merge(snapshot['metrics'].get(metric.name, []))
+            metrics.append(combined)
+        return metrics
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive: bool):
+        import fcntl  # only imported where snapshots are used: under gunicorn, on Unix
+
+        with open(os.path.join(self.directory, self.LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    @staticmethod
+    def _read(path: str) -> dict | None:
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None  # removed or being replaced
+
+    @staticmethod
+    def _replace(path: str, snapshot: dict):
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, path)
+
+    async def _write_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.write()
+                self.retire_exited()
+            except OSError as e:
+                logger.warning(f"Could not write the metrics snapshot: {e!r}")
+
+
+metrics_snapshots = MetricsSnapshots()
+
+
+def render_metrics() -> str:
+    """
+    Render the metrics in the Prometheus text exposition format.
+
+    With METRICS_DIR set these cover every worker sharing the directory, otherwise only
+    the worker that answers.
+    """
+    metrics = metrics_snapshots.merged() if metrics_snapshots.directory else collect()
+    lines = []
+    for metric in metrics:
+        lines += metric.expose()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,93 @@
+import json
+
+from loguru import logger
+from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import BULK_CHUNK_SIZE
+from app.database.crud import delete_users, set_users_banned, purge_posts
+from app.database.models import User
+from app.database.postgre_db import async_session
+from app.tools.images import remove_avatar_files
+from app.tools.photo_storage import remove_released_photos
+
+
+def _progress(**fields) -> bytes:
+    return (json.dumps(fields) + "\n").encode('utf-8')
+
+
+def _chunks(ids: list[int], size: int):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+async def bulk_user_action(action: str, user_ids: list[int], chunk_size: int = BULK_CHUNK_SIZE):
+    """
+    Delete, ban or unban users chunk by chunk, yielding one NDJSON progress line per chunk.
+
+    Every chunk is its own short transaction in its own session, so an interrupted batch
+    keeps the chunks already done and can simply be resubmitted.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    processed = affected = 0
+    for chunk in _chunks(user_ids, chunk_size):
+        async with async_session() as db:
+            try:
+                if action == 'delete':
+                    changed, orphaned_files, released_photos = await delete_users(db, chunk)
+                    for photo_path, variants in orphaned_files:
+                        remove_avatar_files(photo_path, variants)
+                    await remove_released_photos(released_photos)
+                else:
+                    changed = await set_users_banned(db, chunk, banned=action == 'ban')
+            except SQLAlchemyError as e:
+                logger.exception(f"Bulk {action} failed after {processed} of {len(user_ids)} users")
+                yield _progress(action=action, processed=processed, affected=affected,
+                                total=len(user_ids), done=True, error=e.__class__.__name__)
+                return
+        processed += len(chunk)
+        affected += len(changed)
+        yield _progress(action=action, processed=processed, affected=affected, total=len(user_ids), done=False)
+
+    yield _progress(action=action, processed=processed, affected=affected, total=len(user_ids), done=True)
+
+
+async def bulk_purge_posts(post_ids: list[int] | None = None,
+                           user_ids: list[int] | None = None,
+                           chunk_size: int = BULK_CHUNK_SIZE):
+    """
+    Delete posts by id, or every post of the given authors, at most chunk_size per transaction.
+
+    Yields one NDJSON progress line per chunk.
+    """
+    if post_ids is not None:
+        post_ids = list(dict.fromkeys(post_ids))
+        total = len(post_ids)
+    else:
+        user_ids = list(dict.fromkeys(user_ids or []))
+        async with async_session() as db:
+            total = (await db.execute(select(func.coalesce(func.sum(User.post_count), 0))
+                                      .where(User.id.in_(user_ids)))).scalar()
+
+    purged = 0
+    chunks = _chunks(post_ids, chunk_size) if post_ids is not None else None
+    while True:
+        async with async_session() as db:
+            try:
+                if chunks is not None:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    deleted = await purge_posts(db, post_ids=chunk, limit=chunk_size)
+                else:
+                    deleted = await purge_posts(db, user_ids=user_ids, limit=chunk_size)
+                    if not deleted:
+                        break
+            except SQLAlchemyError as e:
+                logger.exception(f"Post purge failed after {purged} posts")
+                yield _progress(action="purge", purged=purged, total=total, done=True, error=e.__class__.__name__)
+                return
+        purged += deleted
+        yield _progress(action="purge", purged=purged, total=total, done=False)
+
+    yield _progress(action="purge", purged=purged, total=total, done=True)
@@ -0,0 +1,108 @@
+import os
+import uuid
+
+from fastapi import UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.crud import acquire_stored_photo, add_stored_photo, lock_stored_photos, stored_photo_hashes
+from app.database.postgre_db import async_session
+from app.tools.functions import save_upload_to_temp
+from app.tools.images import process_avatar, remove_avatar_files
+
+
+class PreparedAvatar:
+    """
+    An uploaded avatar, hashed and, unless its content was already stored, processed into
+    staged files next to the stored ones. Call discard() once it has been stored or given up.
+    """
+
+    __slots__ = ('temp_filename', 'content_hash', 'destination_dir', 'staged')
+
+    def __init__(self, temp_filename: str, content_hash: str, destination_dir: str, staged: dict | None):
+        self.temp_filename = temp_filename
+        self.content_hash = content_hash
+        self.destination_dir = destination_dir
+        self.staged = staged
+
+    def discard(self):
+        remove_avatar_files(self.temp_filename, self.staged)
+        self.staged = None
+
+
+async def prepare_avatar(upload_file: UploadFile, destination_dir: str) -> PreparedAvatar:
+    """
+    Hash an uploaded avatar and process it into staged, uniquely named files.
+
+    Runs before the request's session is used, so no connection is held while the upload
+    waits for an image worker or is being decoded. Content already stored skips the
+    processing; that check takes a connection only for one query.
+    """
+    temp_filename, content_hash = await save_upload_to_temp(upload_file)
+    prepared = PreparedAvatar(temp_filename, content_hash, destination_dir, None)
+    try:
+        async with async_session() as db:
+            already_stored = content_hash in await stored_photo_hashes(db, [content_hash])
+        if not already_stored:
+            prepared.staged = await process_avatar(temp_filename, destination_dir,
+                                                   f"{content_hash}.{uuid.uuid4().hex}.staged")
+    except BaseException:
+        prepared.discard()
+        raise
+    return prepared
+
+
+async def store_avatar(db: AsyncSession, prepared: PreparedAvatar):
+    """
+    Store a prepared avatar under the SHA-256 of its content.
+
+    Content that is already stored only gains a reference and its staged files are dropped;
+    otherwise the staged files are moved to their final, hash-named paths. The reference is
+    part of the session's transaction, the caller commits it. The hash's lock is held until
+    then, so remove_released_photos cannot delete the files between their being moved and
+    their row being committed; only the database work and the renames happen under it.
+
+    Returns:
+        tuple: The content hash and the variant manifest.
+    """
+    content_hash = prepared.content_hash
+    await lock_stored_photos(db, [content_hash])
+    manifest = await acquire_stored_photo(db, content_hash)
+    if manifest is not None:
+        prepared.discard()
+        return content_hash, manifest
+
+    if prepared.staged is None:
+        # Released since prepare_avatar found it stored, which is rare enough to process under the lock
+        prepared.staged = await process_avatar(prepared.temp_filename, prepared.destination_dir,
+                                               f"{content_hash}.{uuid.uuid4().hex}.staged")
+    manifest = {}
+    for size, variants in prepared.staged.items():
+        manifest[size] = {}
+        for mime_type, staged_path in variants.items():
+            name = os.path.basename(staged_path)
+            path = os.path.join(prepared.destination_dir, content_hash + name[name.rindex('_'):])
+            os.replace(staged_path, path)
+            manifest[size][mime_type] = path
+    prepared.staged = None
+    manifest = await add_stored_photo(db, content_hash, manifest)
+    return content_hash, manifest
+
+
+async def remove_released_photos(released_photos: list[tuple[str, dict]]):
+    """
+    Remove the files of stored photos whose last reference was dropped and committed.
+
+    An upload of the same content may have stored the photo again in the meantime, under
+    the same file names, so the files are only removed for hashes that still have no row,
+    checked under their locks.
+    """
+    if not released_photos:
+        return
+    content_hashes = [content_hash for content_hash, _ in released_photos]
+    async with async_session() as db:
+        await lock_stored_photos(db, content_hashes)
+        stored_again = await stored_photo_hashes(db, content_hashes)
+        for content_hash, manifest in released_photos:
+            if content_hash not in stored_again:
+                remove_avatar_files(None, manifest)
+        await db.commit()
@@ -0,0 +1,52 @@
+from loguru import logger
+
+# Most SQL statements one request to each route may issue, with cold principal and response
+# caches, keyed by method and route template. Checked for every route by
+# `python -m app.database.query_budget_check`; raise a budget only together with the change
+# that needs the extra statement. The bulk moderation budgets cover a single chunk. Every
+# budget includes the principal lookup the auth middleware makes for a signed-in request.
+QUERY_BUDGETS = {
+    # principal, version check, posts, their authors, post count
+    ("GET", "/"): 5,
+    ("GET", "/register"): 1,
+    ("POST", "/register"): 3,
+    ("GET", "/login"): 1,
+    ("POST", "/login"): 2,
+    ("GET", "/logout"): 1,
+    ("GET", "/protected/me"): 1,
+    ("GET", "/protected/profile/{user_id}"): 3,
+    # principal, user, profile, profile again, update, refresh; storing a new photo adds four,
+    # releasing the previous one two, removing its files two more and a role change another two
+    ("POST", "/protected/profile/{user_id}/update"): 16,
+    ("GET", "/protected/profile/{user_id}/delete"): 1,
+    # principal, profile, delete, total count; releasing a stored photo adds two and removing
+    # its files two more
+    ("POST", "/protected/profile/{user_id}/delete"): 8,
+    ("GET", "/posts/all"): 4,
+    ("GET", "/posts/search"): 4,
+    ("GET", "/posts/view/{post_id}"): 4,
+    ("GET", "/posts/new"): 1,
+    # principal, insert, author count, total count, refresh
+    ("POST", "/posts/new"): 5,
+    ("GET", "/posts/edit/{post_id}"): 3,
+    ("POST", "/posts/edit/{post_id}"): 2,
+    ("POST", "/posts/delete/{post_id}"): 2,
+    ("GET", "/admin/users"): 2,
+    ("GET", "/admin/users/{user_id}/posts"): 3,
+    ("GET", "/admin/stats"): 1,
+    # principal; deleting a chunk: profiles, delete, total count, two to release photos and
+    # two to remove their files
+    ("POST", "/admin/users/bulk"): 8,
+    ("POST", "/admin/posts/purge"): 4,
+    ("GET", "/media/avatars/{user_id}"): 2,
+    ("GET", "/metrics"): 1,
+}
+
+
+def check_query_budget(method: str, route: str, statements: int) -> bool:
+    """Log a warning and return False when a request issued more statements than its route allows."""
+    budget = QUERY_BUDGETS.get((method, route))
+    if budget is None or statements <= budget:
+        return True
+    logger.warning(f"{method} {route} issued {statements} SQL statements, its budget is {budget}")
+    return False
@@ -0,0 +1,224 @@
+import functools
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Iterable
+
+from fastapi import Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from app.config import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL, READ_YOUR_WRITES_SECONDS
+from app.tools.functions import etag_matches
+from app.tools.invalidation import invalidation_bus
+
+# Headers repeated on a 304 Not Modified answered from the cache
+VALIDATOR_HEADERS = (b'etag', b'cache-control', b'vary')
+
+
+class CachedResponse:
+    __slots__ = ('body', 'status_code', 'headers', 'tags', 'expires_at', 'size')
+
+    def __init__(self, body: bytes, status_code: int, headers: list, tags: set, expires_at: float):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers
+        self.tags = tags
+        self.expires_at = expires_at
+        self.size = len(body) + sum(len(name) + len(value) for name, value in headers)
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of rendered responses, accounted in bytes and invalidated by tag.
+
+    Entries are tagged when they are stored (for example "feed" or "post:42") and every
+    write that changes what a page shows drops the tags it affects, in every worker. The
+    TTL only bounds staleness for anything not covered by a tag, such as the random
+    background photo.
+
+    A page read from a replica right after one of its tags was dropped may predate the
+    write that dropped it, so such pages are not stored for `holdoff` seconds after an
+    invalidation; replicas are expected to catch up within that time.
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, ttl: int = RESPONSE_CACHE_TTL,
+                 holdoff: float = READ_YOUR_WRITES_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.holdoff = holdoff
+        self.bytes = 0
+        self._invalidated_at: dict[str, float] = {}
+        self._cleared_at = float('-inf')
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._tags: defaultdict[str, set] = defaultdict(set)
+        self._route_stats: defaultdict[str, dict] = defaultdict(lambda: {"hits": 0, "misses": 0, "bypasses": 0})
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: tuple, entry: CachedResponse):
+        if entry.size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        for tag in entry.tags:
+            self._tags[tag].add(key)
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, *tags: str, broadcast: bool = True):
+        now = time.monotonic()
+        if len(self._invalidated_at) > len(tags) + 1024:
+            self._invalidated_at = {tag: at for tag, at in self._invalidated_at.items() if at > now - self.holdoff}
+        for tag in tags:
+            self._invalidated_at[tag] = now
+            for key in list(self._tags.pop(tag, ())):
+                self._remove(key)
+        if broadcast:
+            invalidation_bus.publish('response', list(tags))
+
+    def recently_invalidated(self, tags: set) -> bool:
+        threshold = time.monotonic() - self.holdoff
+        return self._cleared_at > threshold or any(self._invalidated_at.get(tag, threshold) > threshold
+                                                   for tag in tags)
+
+    def clear(self):
+        # Called when invalidations may have been missed, so any tag may have just changed
+        self._cleared_at = time.monotonic()
+        self._entries.clear()
+        self._tags.clear()
+        self.bytes = 0
+
+    def record(self, route: str, outcome: str):
+        self._route_stats[route][outcome] += 1
+
+    def stats(self) -> dict:
+        routes = {}
+        for route, counters in self._route_stats.items():
+            lookups = counters["hits"] + counters["misses"]
+            routes[route] = {**counters, "hit_rate": counters["hits"] / lookups if lookups else 0.0}
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "routes": routes
+        }
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+response_cache = ResponseCache()
+invalidation_bus.subscribe('response',
+                           lambda tags: response_cache.invalidate_tags(*tags, broadcast=False),
+                           response_cache.clear)
+
+
+def role_class(principal: dict | None) -> str:
+    if principal is None:
+        return 'anonymous'
+    return 'admin' if principal['role'] == 'admin' else 'user'
+
+
+async def _tee(body_iterator, raw_headers: list, store: Callable[[bytes, list], None]):
+    chunks = []
+    async for chunk in body_iterator:
+        chunk = chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+        chunks.append(chunk)
+        yield chunk
+    # Only a fully sent page is stored; the replay is a plain response with a known length
+    body = b''.join(chunks)
+    headers = [(name, value) for name, value in raw_headers if name != b'content-length']
+    store(body, headers + [(b'content-length', str(len(body)).encode('latin-1'))])
+
+
+def cached(tags: Callable[[dict, Response], Iterable[str]] | Iterable[str] = ()):
+    """
+    Cache the rendered response of a GET route.
+
+    The key covers the path, the query string and the role class of the caller. Pages
+    greet signed-in users by name, so their entries are also keyed and tagged by user id;
+    anonymous visitors all share one entry. Requests carrying a flash message bypass the
+    cache, and only 200 responses are stored. Pages read from a replica are not stored
+    while their tags were invalidated less than `holdoff` seconds ago. Streaming responses
+    are stored once they have been sent in full. A hit whose stored ETag matches
+    If-None-Match is answered with 304 Not Modified.
+
+    Args:
+        tags: Tags for the stored entry, or a callable receiving the endpoint keyword
+            arguments and the response and returning them.
+    """
+    def decorator(endpoint):
+        route = endpoint.__name__
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs['request']
+            if not response_cache.enabled or request.method != 'GET' or 'top_message' in request.session:
+                response_cache.record(route, "bypasses")
+                return await endpoint(*args, **kwargs)
+
+            principal = getattr(request.state, 'principal', None)
+            user_id = principal['user_id'] if principal else None
+            query = tuple(sorted(request.query_params.multi_items()))
+            key = (route, request.url.path, query, role_class(principal), user_id)
+
+            entry = response_cache.get(key)
+            if entry is not None:
+                response_cache.record(route, "hits")
+                validators = [(name, value) for name, value in entry.headers if name in VALIDATOR_HEADERS]
+                etag = next((value.decode() for name, value in validators if name == b'etag'), None)
+                if etag and etag_matches(request, etag):
+                    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+                    response.raw_headers = validators
+                    return response
+                response = Response(content=entry.body, status_code=entry.status_code)
+                response.raw_headers = list(entry.headers)
+                return response
+
+            response_cache.record(route, "misses")
+            response = await endpoint(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+            entry_tags = set(tags(kwargs, response) if callable(tags) else tags)
+            if user_id is not None:
+                entry_tags.add(f"user:{user_id}")
+            if getattr(request.state, 'read_from_replica', False) and response_cache.recently_invalidated(entry_tags):
+                return response
+
+            def store(body: bytes, headers: list):
+                response_cache.set(key, CachedResponse(body, response.status_code, headers,
+                                                       entry_tags, time.monotonic() + response_cache.ttl))
+
+            body = getattr(response, 'body', None)
+            if body is not None:
+                store(body, list(response.raw_headers))
+            elif isinstance(response, StreamingResponse):
+                response.body_iterator = _tee(response.body_iterator, list(response.raw_headers), store)
+            return response
+
+        return wrapper
+
+    return decorator
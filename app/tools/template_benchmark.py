@@ -0,0 +1,132 @@
+"""
+Compare full and streaming template rendering: time to first byte, total time and peak memory.
+
+Renders root.html and admin/users.html with synthetic data, once with
+Jinja2Templates.TemplateResponse's approach (the whole page into one string) and once
+with the async environment used by StreamingTemplateResponse. Chunks are discarded as
+they are produced, as they would be once written to the socket.
+
+Usage:
+    python -m app.tools.template_benchmark [--posts 21] [--users 10000] [--content-size 4000] [--runs 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.templating import Jinja2Templates
+
+from app.config import BASE_DIR
+from app.tools.templating import async_templates, render_chunks
+
+
+class BenchmarkRequest:
+    def url_for(self, name: str, **path_params):
+        return f"/{name}{path_params.get('path', '')}"
+
+
+def make_post(post_id: int, content_size: int):
+    content = ("Stars, galaxies and nebulae. " * (content_size // 29 + 1))[:content_size]
+    return {'id': post_id,
+            'username': f"user{post_id % 50}",
+            'created_at': datetime(2026, 1, 1) - timedelta(minutes=post_id),
+            'content': content,
+            'truncated_content': content[:100]}
+
+
+def make_contexts(posts: int, users: int, content_size: int) -> dict:
+    request = BenchmarkRequest()
+    admin = {'user_id': 2, 'username': 'admin', 'role': 'admin'}
+    return {
+        'root.html': {
+            "request": request,
+            "user": None,
+            "top_message": None,
+            "posts": [make_post(i, content_size) for i in range(posts)],
+            "unsplash_photo": "/static/img/default_unsplash.jpg",
+            "page": 1,
+            "total_pages": 10,
+            "page_size": posts,
+            "prev_cursor": "prev",
+            "next_cursor": "next"
+        },
+        'admin/users.html': {
+            "request": request,
+            "user": admin,
+            "users": [SimpleNamespace(id=i, role='user', username=f"user{i}", email=f"user{i}@example.com",
+                                      post_count=i % 100, is_banned=False) for i in range(users)],
+            "q": "",
+            "match": "contains",
+            "sort": "id",
+            "page_size": users,
+            "is_first_page": True,
+            "next_cursor": None
+        },
+    }
+
+
+def measure_full(templates: Jinja2Templates, name: str, context: dict):
+    template = templates.get_template(name)
+    start = time.perf_counter()
+    body = template.render(context).encode('utf-8')
+    first_byte = time.perf_counter() - start
+    return first_byte, first_byte, len(body)
+
+
+async def measure_streaming(name: str, context: dict):
+    template = async_templates.get_template(name)
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    async for chunk in render_chunks(template, context):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    return first_byte, time.perf_counter() - start, size
+
+
+async def run_mode(mode: str, templates: Jinja2Templates, name: str, context: dict, runs: int):
+    # Warm up template compilation and caches before measuring
+    if mode == "full":
+        measure_full(templates, name, context)
+    else:
+        await measure_streaming(name, context)
+
+    first_bytes, totals, peaks = [], [], []
+    for _ in range(runs):
+        tracemalloc.start()
+        if mode == "full":
+            first_byte, total, size = measure_full(templates, name, context)
+        else:
+            first_byte, total, size = await measure_streaming(name, context)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        first_bytes.append(first_byte)
+        totals.append(total)
+
+    print(f"  {mode:<9} ttfb {statistics.median(first_bytes) * 1000:8.2f} ms"
+          f"  total {statistics.median(totals) * 1000:8.2f} ms"
+          f"  peak {max(peaks) / 1024:9.1f} KiB  body {size / 1024:9.1f} KiB")
+
+
+async def main(args):
+    templates = Jinja2Templates(directory=os.path.join(BASE_DIR, 'templates'))
+    contexts = make_contexts(args.posts, args.users, args.content_size)
+    print(f"{args.runs} runs each, median times, tracemalloc peak (timings include tracing overhead)")
+    for name, context in contexts.items():
+        print(name)
+        for mode in ("full", "streaming"):
+            await run_mode(mode, templates, name, context, args.runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark full against streaming template rendering.")
+    parser.add_argument("--posts", type=int, default=21, help="posts on the root page")
+    parser.add_argument("--users", type=int, default=10000, help="users on the admin page")
+    parser.add_argument("--content-size", type=int, default=4000, help="characters per post")
+    parser.add_argument("--runs", type=int, default=20, help="measured runs per mode")
+    asyncio.run(main(parser.parse_args()))
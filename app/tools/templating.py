@@ -0,0 +1,107 @@
+import os
+import time
+
+import jinja2
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+from sqlalchemy import inspect
+
+from app.config import BASE_DIR
+from app.tools.metrics import template_duration
+
+# Rendered output is sent in chunks of at least this size, except for the document head
+STREAM_CHUNK_SIZE = 16 * 1024
+HEAD_END = '</head>'
+
+
+@jinja2.pass_context
+def url_for(context: dict, name: str, /, **path_params):
+    return context['request'].url_for(name, **path_params)
+
+
+async_templates = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(BASE_DIR, 'templates')),
+    autoescape=True,
+    enable_async=True
+)
+async_templates.globals['url_for'] = url_for
+
+
+async def render_chunks(template: jinja2.Template, context: dict, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Render a template with the async environment, yielding encoded chunks.
+
+    Everything up to the end of the document head is flushed as soon as it is rendered,
+    so the browser can start fetching stylesheets while the body is still being produced.
+    Only the time spent rendering is recorded, not the time spent waiting on the client.
+    """
+    buffer = []
+    buffered = 0
+    head_sent = False
+    rendering = 0.0
+    start = time.perf_counter()
+    async for piece in template.generate_async(context):
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= chunk_size or (not head_sent and HEAD_END in piece):
+            head_sent = True
+            chunk = ''.join(buffer).encode('utf-8')
+            rendering += time.perf_counter() - start
+            yield chunk
+            start = time.perf_counter()
+            buffer = []
+            buffered = 0
+    if buffer:
+        chunk = ''.join(buffer).encode('utf-8')
+        rendering += time.perf_counter() - start
+        yield chunk
+    else:
+        rendering += time.perf_counter() - start
+    template_duration.observe(rendering, template.name)
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates that records how long every TemplateResponse took to render."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+        template_duration.observe(time.perf_counter() - start, response.template.name)
+        return response
+
+
+def _holds_orm_instances(value) -> bool:
+    if isinstance(value, dict):
+        items = value.values()
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = (value,)
+    return any(inspect(item, raiseerr=False) is not None for item in items)
+
+
+class StreamingTemplateResponse(StreamingResponse):
+    """
+    Drop-in replacement for Jinja2Templates.TemplateResponse that streams the page.
+
+    The context must contain the request, as with TemplateResponse. The template and the
+    context are kept on the response for anything that inspects it afterwards.
+
+    The body is rendered after the route's database session has been closed, when an error
+    can only cut the page short under a 200 status. The context must therefore hold plain
+    values (dicts, result rows) rather than ORM instances, whose unloaded attributes would
+    fail mid-stream; ORM instances are refused up front, while the error is still a 500.
+    """
+
+    def __init__(self, name: str, context: dict, status_code: int = 200, headers: dict | None = None):
+        if 'request' not in context:
+            raise ValueError('context must include a "request" key')
+        orm_keys = [key for key, value in context.items() if key != 'request' and _holds_orm_instances(value)]
+        if orm_keys:
+            raise TypeError(f"context values {orm_keys} hold ORM instances, pass plain values to a streamed template")
+        self.template = async_templates.get_template(name)
+        self.context = context
+        super().__init__(render_chunks(self.template, context),
+                         status_code=status_code,
+                         headers=headers,
+                         media_type='text/html')
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+from loguru import logger
+
+from app.config import (UNSPLASH_ACCESS_KEY,
+                        UNSPLASH_API_URL,
+                        UNSPLASH_QUERY,
+                        UNSPLASH_POOL_TTL,
+                        UNSPLASH_REFRESH_INTERVAL,
+                        UNSPLASH_TIMEOUT,
+                        UNSPLASH_BREAKER_THRESHOLD,
+                        UNSPLASH_BREAKER_COOLDOWN,
+                        UNSPLASH_SHARED_DIR,
+                        DEFAULT_UNSPLASH_PHOTO)
+from app.tools.metrics import unsplash_duration
+
+
+class UnsplashPhotoPool:
+    """
+    In-process pool of Unsplash image URLs.
+
+    The pool is filled by a background task started from the application lifespan, so
+    request handlers never wait on the Unsplash API. A simple circuit breaker stops
+    calling the API after repeated failures and the default photo is served instead.
+    Errors, including malformed responses, count as failures and never end the task.
+
+    With a shared directory, the workers of a host elect one refresher through a file lock:
+    it calls the API and writes the URLs to a file the others read every few seconds. The
+    lock is released when its holder exits, and another worker takes over on its next poll.
+    """
+
+    SHARED_POLL_SECONDS = 5
+
+    def __init__(self,
+                 api_url: str = UNSPLASH_API_URL,
+                 query: str = UNSPLASH_QUERY,
+                 ttl: int = UNSPLASH_POOL_TTL,
+                 refresh_interval: int = UNSPLASH_REFRESH_INTERVAL,
+                 timeout: float = UNSPLASH_TIMEOUT,
+                 breaker_threshold: int = UNSPLASH_BREAKER_THRESHOLD,
+                 breaker_cooldown: int = UNSPLASH_BREAKER_COOLDOWN,
+                 default_photo: str = DEFAULT_UNSPLASH_PHOTO,
+                 shared_dir: str = UNSPLASH_SHARED_DIR):
+        self.api_url = api_url
+        self.query = query
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.default_photo = default_photo
+        self.shared_dir = shared_dir
+
+        self._urls: list[str] = []
+        self._loaded_at = 0.0
+        self._failures = 0
+        self._breaker_open_until = 0.0
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+        self._refresher_lock = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.api_url,
+            headers={
+                "Accept-Version": "v1",
+                "Authorization": f"Client-ID {UNSPLASH_ACCESS_KEY}"
+            },
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=2, max_keepalive_connections=1)
+        )
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        if self._refresher_lock:
+            self._refresher_lock.close()
+            self._refresher_lock = None
+
+    def get_photo(self) -> str:
+        if not self._urls or time.monotonic() - self._loaded_at > self.ttl:
+            return self.default_photo
+        return random.choice(self._urls)
+
+    def breaker_is_open(self) -> bool:
+        return time.monotonic() < self._breaker_open_until
+
+    async def refresh(self) -> bool:
+        if self._client is None or self.breaker_is_open():
+            return False
+
+        params = {
+            "query": self.query,
+            "orientation": "landscape",
+            "per_page": 50
+        }
+        start = time.perf_counter()
+        try:
+            response = await self._client.get("/search/photos", params=params)
+            response.raise_for_status()
+            urls = [result['urls']['regular'] for result in response.json().get('results', [])]
+        except Exception as e:
+            # Besides transport errors, any response that does not have the expected shape
+            if not isinstance(e, httpx.HTTPError):
+                logger.warning(f"Unexpected Unsplash response: {e!r}")
+            unsplash_duration.observe(time.perf_counter() - start, 'error')
+            self._record_failure(e)
+            return False
+
+        unsplash_duration.observe(time.perf_counter() - start, 'ok')
+        self._failures = 0
+        if urls:
+            self._urls = urls
+            self._loaded_at = time.monotonic()
+            if self.shared_dir:
+                self._write_shared(urls)
+        return True
+
+    def is_refresher(self) -> bool:
+        """Whether this process refreshes the pool; always true without a shared directory."""
+        if not self.shared_dir:
+            return True
+        if self._refresher_lock is None:
+            import fcntl  # shared directories are only used under gunicorn, on Unix
+
+            os.makedirs(self.shared_dir, exist_ok=True)
+            lock = open(os.path.join(self.shared_dir, "refresher.lock"), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return False
+            self._refresher_lock = lock
+            logger.info(f"Worker {os.getpid()} refreshes the Unsplash pool")
+        return True
+
+    def load_shared(self) -> bool:
+        """Take the URLs the refresher last wrote, keeping their age."""
+        try:
+            with open(os.path.join(self.shared_dir, "urls.json")) as file:
+                shared = json.load(file)
+        except (OSError, ValueError):
+            return False  # not written yet, or being replaced
+        self._urls = shared['urls']
+        self._loaded_at = time.monotonic() - (time.time() - shared['loaded_at'])
+        return True
+
+    def _write_shared(self, urls: list[str]):
+        path = os.path.join(self.shared_dir, "urls.json")
+        try:
+            with open(f"{path}.tmp", 'w') as file:
+                json.dump({"urls": urls, "loaded_at": time.time()}, file)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not share the Unsplash pool: {e!r}")
+
+    def _record_failure(self, error: Exception):
+        self._failures += 1
+        logger.debug(f"Unsplash request failed ({self._failures} in a row): {error!r}")
+        if self._failures >= self.breaker_threshold:
+            self._breaker_open_until = time.monotonic() + self.breaker_cooldown
+            self._failures = 0
+            logger.warning(f"Unsplash circuit breaker open for {self.breaker_cooldown} seconds")
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                if not self.is_refresher():
+                    self.load_shared()
+                    delay = self.SHARED_POLL_SECONDS
+                elif self._urls and time.monotonic() - self._loaded_at < self.refresh_interval:
+                    # Taken over from another worker, whose last refresh is still recent
+                    delay = self.refresh_interval - (time.monotonic() - self._loaded_at)
+                elif await self.refresh():
+                    delay = self.refresh_interval
+                elif self.breaker_is_open():
+                    delay = self._breaker_open_until - time.monotonic()
+                else:
+                    delay = min(self.refresh_interval, 30)
+            except Exception:
+                # Nothing may end the loop, or the pool would never be refreshed again
+                logger.exception("Unexpected error while refreshing the Unsplash pool")
+                delay = min(self.refresh_interval, 30)
+            await asyncio.sleep(delay)
+
+
+unsplash_pool = UnsplashPhotoPool()
@@ -0,0 +1,170 @@
+"""
+Check of the Unsplash photo pool in app/tools/unsplash.py against a fake Unsplash API.
+
+Serves canned answers from a local server and points an UnsplashPhotoPool at it:
+
+- a normal answer fills the pool and its photos are served;
+- a server error, a malformed answer (a JSON list instead of an object) and an answer
+  slower than the timeout are failures, and the photos already in the pool are kept;
+- repeated failures open the circuit breaker, which stops calling the API until the
+  cooldown is over, and the pool refills once the API answers again;
+- the background refresh keeps running through malformed answers and through an error
+  raised outside of the request itself;
+- pools sharing a directory, like the workers of one host, call the API only once between
+  them, all serve the photos, and another pool takes over when the refresher stops.
+
+Needs nothing but a free local port.
+
+Usage:
+    python -m app.tools.unsplash_check
+"""
+import asyncio
+import sys
+import tempfile
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from loguru import logger
+
+from app.tools.checks import Checks
+from app.tools.unsplash import UnsplashPhotoPool
+
+TIMEOUT = 0.5
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 2
+
+
+class FakeUnsplash:
+    def __init__(self):
+        self.mode = "ok"
+        self.generation = 0
+        self.requests = 0
+
+    def photos(self) -> list[str]:
+        return [f"https://images.example/{self.generation}/{n}.jpg" for n in range(3)]
+
+    def create_app(self) -> FastAPI:
+        fake_app = FastAPI()
+
+        @fake_app.get("/search/photos")
+        async def search_photos():
+            self.requests += 1
+            if self.mode == "error":
+                return JSONResponse({"errors": ["Internal Server Error"]}, status_code=500)
+            if self.mode == "list":
+                return JSONResponse([{"urls": {"regular": url}} for url in self.photos()])
+            if self.mode == "slow":
+                await asyncio.sleep(TIMEOUT * 3)
+            return JSONResponse({"results": [{"urls": {"regular": url}} for url in self.photos()]})
+
+        return fake_app
+
+
+async def run_checks(fake: FakeUnsplash, api_url: str) -> int:
+    checks = Checks()
+    pool = UnsplashPhotoPool(api_url=api_url, ttl=60, refresh_interval=60, timeout=TIMEOUT,
+                             breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN,
+                             default_photo="default", shared_dir="")
+    await pool.start()
+    try:
+        # Requests are driven by hand first; the loop's first refresh is already done by then
+        await asyncio.sleep(0.2)
+        checks.expect("a normal answer fills the pool", pool.get_photo() in fake.photos())
+
+        for mode in ("error", "list", "slow"):
+            fake.mode = mode
+            refreshed = await pool.refresh()
+            checks.expect(f"a {mode} answer is a failure that keeps the pool",
+                          not refreshed and pool.get_photo() in fake.photos())
+
+        checks.expect("the breaker opens after repeated failures", pool.breaker_is_open())
+        requests = fake.requests
+        await pool.refresh()
+        checks.expect("an open breaker stops calling the API", fake.requests == requests)
+
+        fake.mode = "ok"
+        fake.generation += 1
+        await asyncio.sleep(BREAKER_COOLDOWN + 0.1)
+        checks.expect("the pool refills after the cooldown",
+                      await pool.refresh() and pool.get_photo() in fake.photos())
+    finally:
+        await pool.stop()
+
+    pool = UnsplashPhotoPool(api_url=api_url, ttl=60, refresh_interval=0.1, timeout=TIMEOUT,
+                             breaker_threshold=1000, breaker_cooldown=BREAKER_COOLDOWN,
+                             default_photo="default", shared_dir="")
+    refresh = pool.refresh
+
+    async def raise_once() -> bool:
+        pool.refresh = refresh
+        raise RuntimeError("raised outside of the request")
+
+    fake.mode = "list"
+    pool.refresh = raise_once
+    await pool.start()
+    try:
+        # The loop retries failures after min(refresh_interval, 30) seconds
+        await asyncio.sleep(0.5)
+        checks.expect("the refresh loop survives errors",
+                      not pool._task.done() and pool.get_photo() == "default")
+        fake.mode = "ok"
+        fake.generation += 1
+        await asyncio.sleep(0.5)
+        checks.expect("the refresh loop fills the pool once the API recovers", pool.get_photo() in fake.photos())
+    finally:
+        await pool.stop()
+
+    with tempfile.TemporaryDirectory() as shared_dir:
+        fake.generation += 1
+        requests = fake.requests
+        pools = [UnsplashPhotoPool(api_url=api_url, ttl=60, refresh_interval=60, timeout=TIMEOUT,
+                                   default_photo="default", shared_dir=shared_dir) for _ in range(3)]
+        try:
+            for pool in pools:
+                await pool.start()
+            await asyncio.sleep(UnsplashPhotoPool.SHARED_POLL_SECONDS + 0.5)
+            checks.expect("pools sharing a directory call the API once", fake.requests == requests + 1,
+                          f"{fake.requests - requests} calls")
+            checks.expect("every pool serves the shared photos", all(pool.get_photo() in fake.photos()
+                                                                     for pool in pools))
+
+            refresher = next((pool for pool in pools if pool._refresher_lock), None)
+            if refresher is not None:
+                await refresher.stop()
+                pools.remove(refresher)
+                await asyncio.sleep(UnsplashPhotoPool.SHARED_POLL_SECONDS + 0.5)
+            checks.expect("another pool takes over from a stopped refresher, without calling the API early",
+                          any(pool._refresher_lock for pool in pools) and fake.requests == requests + 1)
+        finally:
+            for pool in pools:
+                await pool.stop()
+
+    return checks.failures
+
+
+async def main():
+    fake = FakeUnsplash()
+    server = uvicorn.Server(uvicorn.Config(fake.create_app(), host="127.0.0.1", port=0, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            return 1
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    try:
+        failures = await run_checks(fake, f"http://127.0.0.1:{port}")
+    finally:
+        server.should_exit = True
+        await serving
+
+    if failures:
+        logger.error(f"{failures} Unsplash pool failure(s)")
+        return 1
+    logger.info("The Unsplash pool behaves as expected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,105 @@
+"""
+Measure concurrent avatar uploads and their effect on the latency of other pages.
+
+Signs in to a running server, then --connections connections upload avatars to the
+account's profile back to back for --duration seconds, while GET / is probed at a fixed
+pace. Every upload carries different bytes (a counter appended after the JPEG end marker,
+which decoders ignore), so none is deduplicated by content and each one is decoded and
+resized. With --oversized, each connection instead sends bodies over the upload limit,
+which should be turned away before they are read.
+
+Usage:
+    python -m app.tools.upload_benchmark --url http://localhost:8000 --username alice --password secret \
+        [--connections 8] [--duration 20] [--size 3000] [--oversized]
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import os
+import time
+
+import httpx
+from PIL import Image
+
+from app.config import MAX_AVATAR_UPLOAD_BYTES
+from app.tools.load_benchmark import report
+from app.tools.login_benchmark import probe
+from app.tools.upload_limit import MULTIPART_OVERHEAD_BYTES
+
+
+def make_jpeg(size: int) -> bytes:
+    # Noise does not compress, which keeps the file close to a real camera photo in size
+    image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+async def sign_in(client: httpx.AsyncClient, username: str, password: str) -> int:
+    response = await client.post("/login", data={"username": username, "password": password})
+    # The auth cookies are marked Secure; set them again so they are also sent over plain http
+    for name in ("access_token", "refresh_token"):
+        if name in response.cookies:
+            client.cookies.set(name, response.cookies[name])
+    response = await client.get("/protected/me")
+    location = response.headers.get("location", "")
+    if not location.startswith("/protected/profile/"):
+        raise SystemExit(f"Could not sign in as {username}")
+    return int(location.rsplit("/", 1)[1])
+
+
+async def upload(client: httpx.AsyncClient, path: str, image: bytes, counter, stop_at: float,
+                 latencies: list, outcomes: dict):
+    while time.perf_counter() < stop_at:
+        content = image + str(next(counter)).encode()
+        sent = time.perf_counter()
+        try:
+            response = await client.post(path, files={"user_photo": ("avatar.jpg", content, "image/jpeg")})
+            outcome = "error" if response.status_code >= 500 else "ok"
+        except httpx.HTTPError:
+            outcome = "error"
+        outcomes[outcome] += 1
+        if outcome == "ok":
+            latencies.append(time.perf_counter() - sent)
+
+
+async def main(args):
+    if args.oversized:
+        image = make_jpeg(64) + b"\0" * (MAX_AVATAR_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+    else:
+        image = make_jpeg(args.size)
+    print(f"Uploading {len(image) / 1024 / 1024:.1f} MiB per request")
+
+    # One cookie jar for all connections: the flash messages left in the session do not matter here
+    async with httpx.AsyncClient(base_url=args.url, timeout=60,
+                                 limits=httpx.Limits(max_connections=args.connections + 1)) as client, \
+            httpx.AsyncClient(base_url=args.url, timeout=30) as probe_client:
+        user_id = await sign_in(client, args.username, args.password)
+        path = f"/protected/profile/{user_id}/update"
+
+        latencies = []
+        outcomes = {"ok": 0, "error": 0}
+        counter = itertools.count()
+        stop_at = time.perf_counter() + args.duration
+        uploads = [asyncio.create_task(upload(client, path, image, counter, stop_at, latencies, outcomes))
+                   for _ in range(args.connections)]
+        probe_latencies, probe_errors = await probe(probe_client, "/", args.probe_interval, args.duration)
+        await asyncio.gather(*uploads)
+
+    report(f"POST {path}", latencies,
+           f"{len(latencies) / args.duration:.1f} uploads/s, {outcomes['error']} errors")
+    report("GET / during the uploads", probe_latencies, f"{probe_errors} errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure concurrent avatar uploads against a running server.")
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of the server")
+    parser.add_argument("--username", required=True, help="existing account whose avatar is replaced")
+    parser.add_argument("--password", required=True, help="its password")
+    parser.add_argument("--connections", type=int, default=8, help="concurrent uploads")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to upload for")
+    parser.add_argument("--size", type=int, default=3000, help="width and height of the uploaded image in pixels")
+    parser.add_argument("--oversized", action="store_true", help="send bodies over MAX_AVATAR_UPLOAD_BYTES instead")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probes of /")
+    asyncio.run(main(parser.parse_args()))
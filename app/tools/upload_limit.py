@@ -0,0 +1,66 @@
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import MAX_AVATAR_UPLOAD_BYTES
+from app.tools.functions import avatar_too_large_exception, redirect_with_message
+from templates.icons import WARNING_CLASS, WARNING_ICON
+
+# Room for the other form fields and the multipart boundaries around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """
+    Reject multipart bodies too large to hold an acceptable avatar before they are parsed.
+
+    FastAPI parses and spools the whole form before the handler runs, so the size check in
+    save_upload_to_temp only sees uploads that were already received in full. A declared
+    Content-Length over the limit is answered straight away, with the same flash message
+    and redirect back to the form's page as the handler would give, without reading the
+    body. Bodies without a Content-Length are counted as they arrive and cut off with 413
+    once they exceed it.
+
+    Must be added before SessionMiddleware, so that it runs inside it.
+    """
+
+    def __init__(self, app: ASGIApp, max_body_bytes: int = MAX_AVATAR_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get("content-length")
+        if content_length is not None:
+            if content_length.isdigit() and int(content_length) > self.max_body_bytes:
+                path = scope["path"]
+                form_page = path.removesuffix("/update") if path.endswith("/update") else "/"
+                response = await redirect_with_message(request=Request(scope),
+                                                       message_class=WARNING_CLASS,
+                                                       message_icon=WARNING_ICON,
+                                                       message_text=avatar_too_large_exception.detail,
+                                                       endpoint=form_page)
+                await response(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise avatar_too_large_exception
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -10,6 +10,12 @@ wait_for_db() {
 
 wait_for_db
 
+# Migrations run once per container, before any worker starts
 alembic upgrade head
 
-uvicorn app.main:app --host 0.0.0.0 --port 8000
+# A command given to the container (e.g. a single "uvicorn ... --reload" for development) replaces the default
+if [ "$#" -gt 0 ]; then
+    exec "$@"
+fi
+
+exec gunicorn -c gunicorn.conf.py app.main:app
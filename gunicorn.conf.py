@@ -0,0 +1,48 @@
+"""
+Gunicorn settings for serving with several uvicorn worker processes.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The application is imported once in the master (preload_app) and forked into
+WEB_CONCURRENCY workers. Database pools, caches and background tasks are per worker:
+pools inherited from the master are dropped right after the fork, and the lifespan of
+each worker starts its own cache invalidation listener and metrics snapshots. The
+Unsplash refresh runs in one worker, elected through UNSPLASH_SHARED_DIR, and the others
+read the photos it found. Migrations are not run here; the entrypoint runs them once before starting.
+
+`kill -HUP <master pid>` replaces the workers gracefully: each old worker finishes its
+requests (up to GRACEFUL_TIMEOUT seconds) while new ones take over. Because the
+application is preloaded, new code is only picked up by restarting the master.
+"""
+import os
+import shutil
+import tempfile
+from os import getenv
+
+bind = f"0.0.0.0:{getenv('PORT', '8000')}"
+workers = int(getenv('WEB_CONCURRENCY', '2'))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(getenv('GRACEFUL_TIMEOUT', '30'))
+keepalive = int(getenv('GUNICORN_KEEPALIVE', '5'))
+accesslog = "-"
+
+# Read by app.config when the application is preloaded, so /metrics on any worker reports them all
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'spacesite-metrics'))
+# Likewise, so that one worker calls the Unsplash API for all of them
+os.environ.setdefault('UNSPLASH_SHARED_DIR', os.path.join(tempfile.gettempdir(), 'spacesite-unsplash'))
+
+
+def on_starting(server):
+    # Snapshots of a previous run would be merged into this one's totals
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    from app.database.postgre_db import engine, replica_engines
+
+    # Connections must never be shared between processes: forget the inherited ones
+    # without closing them, so the master's sockets are left alone
+    for db_engine in (engine, *replica_engines):
+        db_engine.sync_engine.dispose(close=False)